@@ -1,9 +1,101 @@
+import uuid
+from django.conf import settings
 from django.contrib import admin
-from .models import Document
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Document, DocumentProfile, UploadSession
+
+def estimate_table_rows(model, using='default'):
+    """The database's own cheap estimate of a table's rows, or None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Kept current by autovacuum's ANALYZE; -1 before the first one
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        elif connection.vendor == 'sqlite':
+            # The newest rowid, read off the end of the table's B-tree
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a whole large table: the unfiltered
+    changelist uses the database's estimate, and filtered ones are counted
+    exactly only up to ADMIN_COUNT_LIMIT rows. A filter or search matching
+    more rows than that is reported as ADMIN_COUNT_LIMIT results, and only
+    its first ADMIN_COUNT_LIMIT rows can be paged to; narrow the filter to
+    reach the rest.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > settings.ADMIN_COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
+
+class ContentTypeFilter(admin.SimpleListFilter):
+    """The accepted content types, without a DISTINCT over the table"""
+    title = 'content type'
+    parameter_name = 'content_type'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('application/pdf', 'PDF'),
+            ('application/msword', 'Word (.doc)'),
+            ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'Word (.docx)'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(content_type=self.value())
+        return queryset
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ['id', 'original_filename', 'status', 'file_size', 'uploaded_at']
-    list_filter = ['status', 'content_type', 'uploaded_at']
-    search_fields = ['original_filename', 'id']
-    readonly_fields = ['id', 'uploaded_at', 'processed_at']
\ No newline at end of file
+    list_filter = ['status', ContentTypeFilter, 'uploaded_at']
+    search_fields = ['original_filename']
+    search_help_text = 'Filename prefix, or an exact document ID'
+    readonly_fields = ['id', 'uploaded_at', 'processed_at']
+    date_hierarchy = 'uploaded_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Exact ID lookup or an indexed filename prefix range, never LIKE '%term%'"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(id=uuid.UUID(term)), False
+        except ValueError:
+            pass
+        # The range is what the filename index serves; startswith keeps the
+        # match exact where the collation does not order by code point
+        return queryset.filter(
+            original_filename__gte=term,
+            original_filename__lt=term + '\U0010ffff',
+            original_filename__startswith=term,
+        ), False
+
+@admin.register(DocumentProfile)
+class DocumentProfileAdmin(admin.ModelAdmin):
+    list_display = ['id', 'document', 'kind', 'trigger', 'profiler', 'duration', 'created_at']
+    list_filter = ['kind', 'trigger', 'profiler']
+    readonly_fields = ['document', 'kind', 'trigger', 'profiler', 'duration', 'report', 'created_at']
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'original_filename', 'status', 'received', 'size', 'updated_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'checksum', 'received', 'document', 'created_at', 'updated_at']
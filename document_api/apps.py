@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class DocumentApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'document_api'
\ No newline at end of file
+    name = 'document_api'
+
+    def ready(self):
+        from .database import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='document_api.configure_sqlite')
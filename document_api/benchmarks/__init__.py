@@ -0,0 +1,46 @@
+import time
+import tracemalloc
+
+def measure(func, *args, repeat=3):
+    """
+    Time `func(*args)` and record its peak Python heap allocation.
+
+    Timing uses the best of `repeat` runs without tracing; peak memory is
+    taken from one separate traced run so tracing does not skew timings.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(timings), 'peak_memory': peak}, result
+
+def compare(results, baseline, threshold):
+    """
+    Results whose time or peak memory grew by more than `threshold`
+    (a fraction, 0.2 = 20%) over the matching baseline result
+    """
+    previous = {result['name']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result['name'])
+        if not base or 'error' in result or 'error' in base:
+            continue
+        for metric in ('seconds', 'peak_memory'):
+            if base.get(metric) and result[metric] > base[metric] * (1 + threshold):
+                regressions.append({
+                    'name': result['name'],
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': result[metric],
+                })
+    return regressions
@@ -0,0 +1,254 @@
+import random
+import struct
+import zipfile
+from xml.sax.saxutils import escape
+from ..ole2 import (
+    DIFSECT, ENDOFCHAIN, FATSECT, FIB_CLX, FIB_FLAG_WHICH_TABLE, FREESECT, NOSTREAM,
+    OLE2_SIGNATURE, STGTY_ROOT, STGTY_STREAM, WORD_IDENT,
+)
+
+WORDS = (
+    "agreement party shall provide service within days notice written term payment "
+    "invoice delivery contract obligation liability period section clause schedule "
+    "the a of to and in for with on by under this that such any all each other"
+).split()
+
+def synthetic_text(size_bytes, seed=0):
+    """Deterministic paragraphs of filler text, roughly `size_bytes` long"""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            words = rng.choices(WORDS, k=rng.randint(6, 20))
+            sentences.append(' '.join(words).capitalize() + '.')
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)
+
+def _directory_entry(name, entry_type, start, size, child=NOSTREAM, right=NOSTREAM):
+    encoded = (name + '\0').encode('utf-16-le') if name else b''
+    entry = bytearray(128)
+    entry[:len(encoded)] = encoded
+    struct.pack_into('<HBB', entry, 64, len(encoded), entry_type, 1)
+    struct.pack_into('<III', entry, 68, NOSTREAM, right, child)
+    struct.pack_into('<IQ', entry, 116, start, size)
+    return bytes(entry)
+
+def write_compound_file(path, streams, sector_size=512):
+    """
+    Write a version 3 OLE2 compound file holding top-level `streams`.
+    Every stream is padded past the mini stream cutoff, so no mini FAT is
+    needed.
+    """
+    per_sector = sector_size // 4
+    padded = []
+    for name, data in streams:
+        data = data + b'\0' * max(0, 4096 - len(data))
+        padded.append((name, len(data), data + b'\0' * (-len(data) % sector_size)))
+
+    starts = []
+    data_sectors = 0
+    for _, _, data in padded:
+        starts.append(data_sectors)
+        data_sectors += len(data) // sector_size
+
+    entries = [_directory_entry('Root Entry', STGTY_ROOT, ENDOFCHAIN, 0, child=1)]
+    for index, ((name, size, _), start) in enumerate(zip(padded, starts), 1):
+        right = index + 1 if index < len(padded) else NOSTREAM
+        entries.append(_directory_entry(name, STGTY_STREAM, start, size, right=right))
+    directory = b''.join(entries)
+    directory += _directory_entry('', 0, 0, 0) * (-len(entries) % (sector_size // 128))
+    directory_sectors = len(directory) // sector_size
+
+    fat_count = difat_count = 0
+    while True:
+        total = data_sectors + directory_sectors + fat_count + difat_count
+        needed_fat = -(-total // per_sector)
+        needed_difat = max(0, -(-(needed_fat - 109) // (per_sector - 1)))
+        if (needed_fat, needed_difat) == (fat_count, difat_count):
+            break
+        fat_count, difat_count = needed_fat, needed_difat
+
+    fat = []
+    for start, (_, _, data) in zip(starts, padded):
+        count = len(data) // sector_size
+        fat.extend(range(start + 1, start + count))
+        fat.append(ENDOFCHAIN)
+    directory_start = len(fat)
+    fat.extend(range(directory_start + 1, directory_start + directory_sectors))
+    fat.append(ENDOFCHAIN)
+    fat_start = len(fat)
+    fat.extend([FATSECT] * fat_count)
+    difat_start = len(fat)
+    fat.extend([DIFSECT] * difat_count)
+    fat.extend([FREESECT] * (fat_count * per_sector - len(fat)))
+
+    fat_sectors = list(range(fat_start, fat_start + fat_count))
+    header = bytearray(512)
+    header[:8] = OLE2_SIGNATURE
+    struct.pack_into('<HHHHH', header, 0x18, 0x3E, 3, 0xFFFE, sector_size.bit_length() - 1, 6)
+    struct.pack_into('<IIIIIIII', header, 0x2C,
+                     fat_count, directory_start, 0, 4096,
+                     ENDOFCHAIN, 0, difat_start if difat_count else ENDOFCHAIN, difat_count)
+    head = fat_sectors[:109] + [FREESECT] * (109 - min(109, fat_count))
+    struct.pack_into('<109I', header, 0x4C, *head)
+
+    with open(path, 'wb') as file:
+        file.write(bytes(header) + b'\0' * (sector_size - 512))
+        for _, _, data in padded:
+            file.write(data)
+        file.write(directory)
+        file.write(struct.pack(f'<{len(fat)}I', *fat))
+        remaining = fat_sectors[109:]
+        for index in range(difat_count):
+            chunk = remaining[index * (per_sector - 1):(index + 1) * (per_sector - 1)]
+            chunk += [FREESECT] * (per_sector - 1 - len(chunk))
+            following = difat_start + index + 1 if index + 1 < difat_count else ENDOFCHAIN
+            file.write(struct.pack(f'<{per_sector}I', *chunk, following))
+
+def write_doc(path, text):
+    """Write `text` as a minimal Word 97-2003 document with one text piece"""
+    try:
+        text_bytes = text.replace('\n', '\r').encode('cp1252')
+        compressed = True
+    except UnicodeEncodeError:
+        text_bytes = text.replace('\n', '\r').encode('utf-16-le')
+        compressed = False
+    character_count = len(text)
+
+    # FibBase, then FibRgW97 (14 words), FibRgLw97 (22 longs), FibRgFcLcb97 (93 pairs)
+    text_offset = 0x800
+    fib = bytearray(text_offset)
+    struct.pack_into('<HH', fib, 0, WORD_IDENT, 0x00C1)
+    struct.pack_into('<H', fib, 0x0A, FIB_FLAG_WHICH_TABLE)
+    struct.pack_into('<H', fib, 32, 14)
+    struct.pack_into('<H', fib, 62, 22)
+    struct.pack_into('<I', fib, 64, text_offset + len(text_bytes))
+    struct.pack_into('<I', fib, 64 + 3 * 4, character_count)
+    struct.pack_into('<H', fib, 152, 93)
+
+    fc = (text_offset * 2) | 0x40000000 if compressed else text_offset
+    plc = struct.pack('<IIHIH', 0, character_count, 0, fc, 0)
+    clx = b'\x02' + struct.pack('<I', len(plc)) + plc
+    struct.pack_into('<II', fib, 154 + FIB_CLX * 8, 0, len(clx))
+
+    write_compound_file(path, [('WordDocument', bytes(fib) + text_bytes), ('1Table', clx)])
+
+_DOCX_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_DOCX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/header1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>
+<Override PartName="/word/footnotes.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>
+</Types>'''
+_DOCX_PACKAGE_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>'''
+_DOCX_DOCUMENT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" Target="header1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes" Target="footnotes.xml"/>
+</Relationships>'''
+
+def _docx_paragraph(text):
+    return f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+def write_docx(path, text, table_every=20):
+    """
+    Write `text` as a DOCX package, one paragraph per blank-line separated
+    block. Every `table_every`-th block goes into a one-cell table, and the
+    package has a header and a footnote, so every text part is exercised.
+    document.xml is streamed into the archive to keep generation memory flat.
+    """
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _DOCX_PACKAGE_RELS)
+        archive.writestr('word/_rels/document.xml.rels', _DOCX_DOCUMENT_RELS)
+        archive.writestr('word/header1.xml', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<w:hdr xmlns:w="{_DOCX_NAMESPACE}">{_docx_paragraph("Synthetic benchmark header")}</w:hdr>'
+        ))
+        archive.writestr('word/footnotes.xml', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<w:footnotes xmlns:w="{_DOCX_NAMESPACE}"><w:footnote w:id="1">'
+            f'{_docx_paragraph("Synthetic benchmark footnote")}</w:footnote></w:footnotes>'
+        ))
+        with archive.open('word/document.xml', 'w', force_zip64=True) as document:
+            document.write((
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<w:document xmlns:w="{_DOCX_NAMESPACE}"><w:body>'
+            ).encode('utf-8'))
+            for index, paragraph in enumerate(text.split('\n\n')):
+                block = _docx_paragraph(paragraph)
+                if table_every and index % table_every == table_every - 1:
+                    block = f'<w:tbl><w:tr><w:tc>{block}</w:tc></w:tr></w:tbl>'
+                document.write(block.encode('utf-8'))
+            document.write(b'<w:sectPr/></w:body></w:document>')
+
+def _pdf_escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _wrap_lines(text, width):
+    for paragraph in text.split('\n\n'):
+        line = []
+        length = 0
+        for word in paragraph.split():
+            if line and length + len(word) + 1 > width:
+                yield ' '.join(line)
+                line = []
+                length = 0
+            line.append(word)
+            length += len(word) + 1
+        yield ' '.join(line)
+        yield ''
+
+def write_pdf(path, text, lines_per_page=50, line_width=90):
+    """
+    Write `text` as an uncompressed, deterministic PDF with one Helvetica
+    text block per page. Pages are streamed to disk as they are built.
+    """
+    offsets = {}
+    page_ids = []
+
+    with open(path, 'wb') as file:
+        def write_object(number, body):
+            offsets[number] = file.tell()
+            file.write(f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n')
+
+        file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        write_object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+        next_id = 4
+        lines = _wrap_lines(text, line_width)
+        while True:
+            page_lines = [line for _, line in zip(range(lines_per_page), lines)]
+            if not page_lines:
+                break
+            content = 'BT /F1 10 Tf 14 TL 50 750 Td\n' + ''.join(
+                f'({_pdf_escape(line)}) Tj T*\n' for line in page_lines
+            ) + 'ET'
+            content = content.encode('latin-1', 'replace')
+            write_object(next_id, f'<< /Length {len(content)} >>\nstream\n'.encode('latin-1') + content + b'\nendstream')
+            write_object(next_id + 1, (
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                f'/Resources << /Font << /F1 3 0 R >> >> /Contents {next_id} 0 R >>'
+            ).encode('latin-1'))
+            page_ids.append(next_id + 1)
+            next_id += 2
+
+        kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+        write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode('latin-1'))
+
+        xref_offset = file.tell()
+        file.write(f'xref\n0 {next_id}\n0000000000 65535 f \n'.encode('latin-1'))
+        for number in range(1, next_id):
+            file.write(f'{offsets[number]:010d} 00000 n \n'.encode('latin-1'))
+        file.write(f'trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('latin-1'))
+    return len(page_ids)
@@ -0,0 +1,149 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import setup_test_environment, teardown_test_environment
+from .corpus import synthetic_text, write_pdf
+from .queueing import percentile
+from ..models import Document
+
+# Uploading threads per run; each is joined by STATUS_POLLERS status pollers
+DEFAULT_THREADS = (8,)
+STATUS_POLLERS = 2
+UPLOADS_PER_THREAD = 20
+POLLS_PER_THREAD = 60
+UPLOAD_TEXT_BYTES = 8 * 1024
+HOST = '127.0.0.1'
+# Django's defaults before the database layer: rollback journal, a new connection per request
+BASELINE = {'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'}, 'conn_max_age': 0}
+
+@contextmanager
+def file_database(path, conn_max_age):
+    """A throwaway on-disk SQLite test database, shared by every thread"""
+    database = connections.settings['default']
+    saved = {key: database.get(key) for key in ('TEST', 'CONN_MAX_AGE')}
+    database['TEST'] = {**(database.get('TEST') or {}), 'NAME': path}
+    database['CONN_MAX_AGE'] = conn_max_age
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        database.update(saved)
+
+def call(application, method, path, body=b'', content_type=''):
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'HTTP_HOST': HOST,
+        'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+    }
+    setup_testing_defaults(environ)
+    statuses = []
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        # Fires request_finished, which closes or keeps the connection per CONN_MAX_AGE
+        response.close()
+    return int(statuses[0].split()[0])
+
+def run_mode(application, threads, payload, document_id):
+    """Parallel uploads with status polling; returns latencies by kind, errors and seconds"""
+    latencies = {'upload': [], 'status': []}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(kind, count):
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    if kind == 'upload':
+                        upload = io.BytesIO(payload)
+                        upload.name = 'upload.pdf'
+                        code = call(application, 'POST', '/api/upload/', encode_multipart(BOUNDARY, {'file': upload}), MULTIPART_CONTENT)
+                        failed = code != 201
+                    else:
+                        failed = call(application, 'GET', f'/api/status/{document_id}/') != 200
+                except Exception as e:
+                    failed = repr(e)
+                with lock:
+                    latencies[kind].append(time.perf_counter() - started)
+                    if failed:
+                        errors.append(failed)
+        finally:
+            connection.close()
+
+    workers = []
+    for _ in range(threads):
+        workers.append(threading.Thread(target=worker, args=('upload', UPLOADS_PER_THREAD)))
+        for _ in range(STATUS_POLLERS):
+            workers.append(threading.Thread(target=worker, args=('status', POLLS_PER_THREAD)))
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_THREADS):
+    """
+    Uploads (processed in the request) and status polls from many threads
+    against an on-disk SQLite database, with Django's defaults and with
+    the tuned configuration. `sizes_mb` is read as the numbers of
+    uploading threads; the best of `repeat` runs is kept.
+    """
+    modes = (
+        ('sqlite-default', BASELINE),
+        ('sqlite-tuned', {'pragmas': settings.SQLITE_PRAGMAS, 'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0)}),
+    )
+    request_logger = logging.getLogger('django.request')
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        pdf_path = os.path.join(scratch, 'upload.pdf')
+        write_pdf(pdf_path, synthetic_text(UPLOAD_TEXT_BYTES))
+        with open(pdf_path, 'rb') as pdf:
+            payload = pdf.read()
+        application = get_wsgi_application()
+        level = request_logger.level
+        # Failed requests are counted, not logged
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            for threads in sizes_mb:
+                for mode, config in modes:
+                    overrides = override_settings(
+                        MEDIA_ROOT=os.path.join(scratch, 'media'), SQLITE_PRAGMAS=config['pragmas'],
+                        EXTRACTION_SANDBOX=False, DOCUMENT_TASKS_ASYNC=False,
+                    )
+                    with overrides, file_database(os.path.join(scratch, f'{mode}.sqlite3'), config['conn_max_age']):
+                        document_id = Document.objects.create(
+                            original_filename='polled.pdf', file_size=len(payload), content_type='application/pdf'
+                        ).id
+                        best = {}
+                        for _ in range(repeat):
+                            latencies, errors, seconds = run_mode(application, threads, payload, document_id)
+                            operations = sum(len(values) for values in latencies.values())
+                            for kind, values in latencies.items():
+                                for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+                                    key = f'{kind}-{label}'
+                                    best[key] = min(best.get(key, float('inf')), percentile(values, fraction))
+                            best['errors'] = min(best.get('errors', float('inf')), len(errors))
+                            best['ops_per_second'] = max(best.get('ops_per_second', 0), operations / seconds)
+                        for key in ('upload-p50', 'upload-p99', 'status-p50', 'status-p99'):
+                            results.append({
+                                'name': f'{mode}-{threads}/{key}', 'bytes': 0, 'seconds': best[key], 'peak_memory': 0,
+                                'errors': best['errors'], 'ops_per_second': best['ops_per_second'],
+                            })
+        finally:
+            request_logger.setLevel(level)
+    return results
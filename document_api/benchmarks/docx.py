@@ -0,0 +1,42 @@
+import glob
+import os
+import tempfile
+from . import measure
+from .corpus import synthetic_text, write_docx
+from ..docx_stream import iter_docx_paragraphs
+from ..tasks import extract_docx_text_with_python_docx
+
+DEFAULT_SIZES_MB = (1, 10)
+
+def build_corpus(directory, sizes_mb=DEFAULT_SIZES_MB):
+    """Write one deterministic synthetic .docx file per size of body text"""
+    paths = []
+    for size in sizes_mb:
+        path = os.path.join(directory, f'synthetic_{size}mb.docx')
+        write_docx(path, synthetic_text(size * 1024 * 1024, seed=size))
+        paths.append(path)
+    return paths
+
+def count_characters(path):
+    """Consume the paragraph stream without keeping it, so peak memory is the reader's own"""
+    return sum(len(paragraph) + 1 for paragraph in iter_docx_paragraphs(path))
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_SIZES_MB):
+    """
+    Compare streaming DOCX extraction with the python-docx object model
+    over every .docx file in `corpus_dir`, or over a synthetic corpus
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        if corpus_dir:
+            paths = sorted(glob.glob(os.path.join(corpus_dir, '**', '*.docx'), recursive=True))
+        else:
+            paths = build_corpus(scratch, sizes_mb)
+
+        for path in paths:
+            name = os.path.relpath(path, corpus_dir or scratch)
+            streaming, characters = measure(count_characters, path, repeat=repeat)
+            baseline, _ = measure(extract_docx_text_with_python_docx, path, repeat=repeat)
+            results.append({'name': name, 'bytes': os.path.getsize(path), 'characters': characters, **streaming})
+            results.append({'name': f'{name} (python-docx)', 'bytes': os.path.getsize(path), **baseline})
+    return results
@@ -0,0 +1,43 @@
+import glob
+import os
+import tempfile
+from . import measure
+from .corpus import synthetic_text, write_doc
+from ..ole2 import OLE2Error, iter_doc_text
+
+DEFAULT_SIZES_MB = (1, 10)
+
+def build_corpus(directory, sizes_mb=DEFAULT_SIZES_MB):
+    """Write one deterministic synthetic .doc file per size"""
+    paths = []
+    for size in sizes_mb:
+        path = os.path.join(directory, f'synthetic_{size}mb.doc')
+        write_doc(path, synthetic_text(size * 1024 * 1024, seed=size))
+        paths.append(path)
+    return paths
+
+def count_characters(path):
+    """Consume the text stream without keeping it, so peak memory is the reader's own"""
+    return sum(len(chunk) for chunk in iter_doc_text(path))
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_SIZES_MB):
+    """
+    Benchmark legacy .doc extraction over every .doc file in `corpus_dir`,
+    or over a synthetic corpus when no directory is given
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        if corpus_dir:
+            paths = sorted(glob.glob(os.path.join(corpus_dir, '**', '*.doc'), recursive=True))
+        else:
+            paths = build_corpus(scratch, sizes_mb)
+
+        for path in paths:
+            result = {'name': os.path.relpath(path, corpus_dir or scratch), 'bytes': os.path.getsize(path)}
+            try:
+                stats, characters = measure(count_characters, path, repeat=repeat)
+                result.update(stats, characters=characters)
+            except (OLE2Error, OSError) as e:
+                result['error'] = str(e)
+            results.append(result)
+    return results
@@ -0,0 +1,40 @@
+import os
+import tempfile
+from django.test import override_settings
+from . import measure
+from .corpus import synthetic_text, write_pdf
+from .. import page_store
+from ..tasks import extract_pdf_document
+
+# Pages per synthetic PDF
+DEFAULT_PAGES = (10, 100, 500)
+# Text filling one page as write_pdf lays it out (50 lines of 90 characters)
+PAGE_CHARS = 50 * 90
+
+def reparse_page(path, number):
+    """Page `number` the way it was reached before: extracting every page up to it"""
+    extraction = extract_pdf_document(path, max_pages=number)
+    return extraction.text[extraction.page_ends[-2]:] if number > 1 else extraction.text
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_PAGES):
+    """
+    One page from the middle of PDFs of growing length, re-extracted from
+    the PDF against read from the page store. `sizes_mb` is read as page
+    counts; the store's time should stay flat as documents grow.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch, override_settings(MEDIA_ROOT=scratch):
+        for pages in sizes_mb:
+            path = os.path.join(scratch, f'synthetic_{pages}p.pdf')
+            write_pdf(path, synthetic_text(pages * PAGE_CHARS, seed=pages))
+            extraction = extract_pdf_document(path)
+            document_id = f'benchmark-{pages}'
+            page_store.write(document_id, extraction.text, extraction.page_ends)
+            middle = max(1, extraction.pages // 2)
+
+            stats, expected = measure(reparse_page, path, middle, repeat=repeat)
+            results.append({'name': f'reparse/{pages}-pages', 'bytes': os.path.getsize(path), **stats})
+            stats, (_, stored) = measure(page_store.read, document_id, middle, middle, repeat=repeat)
+            results.append({'name': f'store/{pages}-pages', 'bytes': len(stored[0].encode('utf-8')), **stats})
+            assert stored == [expected], f'stored page {middle} of {pages} differs from the PDF'
+    return results
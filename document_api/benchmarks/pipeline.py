@@ -0,0 +1,118 @@
+import glob
+import os
+import tempfile
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from . import measure
+from .corpus import synthetic_text, write_docx, write_pdf
+from ..tasks import create_docx_content, create_pdf_content, extract_docx_text, extract_pdf_text, rewrite_text
+
+DEFAULT_SIZES_MB = (1, 10)
+GUIDELINES = "Fix grammar, make it formal and concise"
+PDF_TYPE = 'application/pdf'
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Payload for the upload view, safely under the upload size limit
+UPLOAD_TEXT_BYTES = 512 * 1024
+
+def build_corpus(directory, sizes_mb=DEFAULT_SIZES_MB):
+    """One PDF and one DOCX per size, both holding the same deterministic text"""
+    corpus = []
+    for size in sizes_mb:
+        text = synthetic_text(size * 1024 * 1024, seed=size)
+        pdf_path = os.path.join(directory, f'synthetic_{size}mb.pdf')
+        write_pdf(pdf_path, text)
+        docx_path = os.path.join(directory, f'synthetic_{size}mb.docx')
+        write_docx(docx_path, text)
+        corpus.append((f'pdf-{size}mb', pdf_path, PDF_TYPE))
+        corpus.append((f'docx-{size}mb', docx_path, DOCX_TYPE))
+    return corpus
+
+def find_corpus(directory):
+    corpus = []
+    for pattern, content_type in (('*.pdf', PDF_TYPE), ('*.docx', DOCX_TYPE)):
+        for path in sorted(glob.glob(os.path.join(directory, '**', pattern), recursive=True)):
+            corpus.append((os.path.relpath(path, directory), path, content_type))
+    return corpus
+
+def modify_cold(text):
+    """Rewrite with an empty paragraph memo, as for a first submission"""
+    cache.clear()
+    return rewrite_text(text, GUIDELINES)
+
+def modify_warm(text):
+    """Rewrite with every paragraph already memoized, as for a resubmission"""
+    return rewrite_text(text, GUIDELINES)
+
+def benchmark_document(name, path, content_type, repeat):
+    """Per-stage results for one document: extract, rewrite and render"""
+    is_pdf = content_type == PDF_TYPE
+    size = os.path.getsize(path)
+    results = []
+
+    stats, text = measure(extract_pdf_text if is_pdf else extract_docx_text, path, repeat=repeat)
+    results.append({'name': f'{name}/extract', 'bytes': size, **stats})
+    text_bytes = len(text.encode('utf-8'))
+
+    stats, _ = measure(modify_cold, text, repeat=repeat)
+    results.append({'name': f'{name}/modify', 'bytes': text_bytes, **stats})
+    stats, change_set = measure(modify_warm, text, repeat=repeat)
+    results.append({'name': f'{name}/modify-memoized', 'bytes': text_bytes, **stats})
+
+    modified_text = change_set.text
+    stats, _ = measure(create_pdf_content if is_pdf else create_docx_content, modified_text, repeat=repeat)
+    results.append({'name': f'{name}/render', 'bytes': len(modified_text.encode('utf-8')), **stats})
+    return results
+
+@contextmanager
+def throwaway_database():
+    """Run against a throwaway test database, never the configured one"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+def benchmark_views(scratch, repeat):
+    """Upload, status and listing views through the full request stack"""
+    upload_path = os.path.join(scratch, 'upload.pdf')
+    write_pdf(upload_path, synthetic_text(UPLOAD_TEXT_BYTES))
+    with open(upload_path, 'rb') as upload_file:
+        payload = upload_file.read()
+
+    media_root = os.path.join(scratch, 'media')
+    with override_settings(MEDIA_ROOT=media_root), throwaway_database():
+        client = Client()
+
+        def upload():
+            uploaded = SimpleUploadedFile('upload.pdf', payload, content_type=PDF_TYPE)
+            response = client.post('/api/upload/', {'file': uploaded})
+            assert response.status_code == 201, response.content
+            return response.json()['document']['id']
+
+        stats, document_id = measure(upload, repeat=repeat)
+        results = [{'name': 'views/upload', 'bytes': len(payload), **stats}]
+
+        stats, _ = measure(client.get, f'/api/status/{document_id}/', repeat=repeat)
+        results.append({'name': 'views/status', 'bytes': 0, **stats})
+        stats, _ = measure(client.get, '/api/documents/', repeat=repeat)
+        results.append({'name': 'views/list', 'bytes': 0, **stats})
+    return results
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_SIZES_MB):
+    """
+    Time every pipeline stage for each document in `corpus_dir`, or in a
+    synthetic PDF/DOCX corpus, followed by the upload and status views
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus = find_corpus(corpus_dir) if corpus_dir else build_corpus(scratch, sizes_mb)
+        for name, path, content_type in corpus:
+            results.extend(benchmark_document(name, path, content_type, repeat))
+        results.extend(benchmark_views(scratch, repeat))
+    return results
@@ -0,0 +1,187 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from celery import Celery
+from celery.contrib.testing.app import setup_default_app
+from django.conf import settings
+from kombu import Queue
+from .corpus import synthetic_text, write_pdf
+from .. import routing
+from ..models import Document
+from ..tasks import extract_pdf_document
+
+DEFAULT_SIZES_MB = (4,)
+# Seconds of traffic per scenario; the run then waits for every task to finish
+DURATION = 30
+SMALL_DOCUMENT_BYTES = 2 * 1024
+SMALL_TENANTS = 5
+SMALL_INTERVAL = 0.1  # mean seconds between small uploads
+# The heavy tenant uploads this many large documents at BURST_AT
+BURST_SIZE = 20
+BURST_AT = 5
+# Another tenant uploads a few large documents while the burst is queued
+LATE_LARGE_DOCUMENTS = 2
+LATE_LARGE_AT = 10
+# Unrouted runs put every task on this one queue, served by all workers
+SHARED_QUEUE = 'shared'
+# Seconds the memory transport sleeps between polls of an empty queue
+POLLING_INTERVAL = 0.005
+# Seconds to wait for the last task once traffic has stopped
+DRAIN_TIMEOUT = 600
+
+Job = namedtuple('Job', ['arrival', 'kind', 'tenant', 'path'])
+
+def generate_jobs(paths, heavy, seed, duration=DURATION, burst=BURST_SIZE):
+    rng = random.Random(seed)
+    jobs = []
+    now = 0.0
+    while now < duration:
+        now += rng.expovariate(1 / SMALL_INTERVAL)
+        jobs.append(Job(now, 'small', f'tenant-{rng.randrange(SMALL_TENANTS)}', paths['small']))
+    if heavy:
+        burst_at = min(BURST_AT, duration / 6)
+        late_at = min(LATE_LARGE_AT, duration / 3)
+        jobs.extend(Job(burst_at, 'large', 'heavy', paths['large']) for _ in range(burst))
+        jobs.extend(Job(late_at + i * 0.1, 'late-large', 'tenant-0', paths['large']) for i in range(LATE_LARGE_DOCUMENTS))
+    jobs.sort(key=lambda job: job.arrival)
+    return jobs
+
+def benchmark_app(queues, finished):
+    """
+    A Celery app on the in-memory broker with one task that extracts a PDF
+    and records when it finished. The memory transport delivers each queue
+    first in, first out and ignores message priority.
+    """
+    app = Celery('queueing-benchmark', broker='memory://', set_as_current=False)
+    app.conf.update(
+        task_queues=[Queue(name, routing_key=name) for name in queues],
+        task_ignore_result=True,
+        task_acks_late=True,
+        # The memory transport's worker loop applies acks only between its
+        # two-second drains, which stalls a full prefetch window; workers
+        # prefetch without a limit and each queue stays first in, first out
+        worker_prefetch_multiplier=0,
+        broker_transport_options={'polling_interval': POLLING_INTERVAL},
+        worker_hijack_root_logger=False,
+    )
+
+    @app.task(name='queueing-benchmark.process', shared=False)
+    def process(document_id, path, job):
+        extract_pdf_document(path)
+        finished[job] = time.perf_counter()
+
+    return app, process
+
+@contextmanager
+def workers(concurrency, finished):
+    """
+    One thread-pool worker per queue, consuming only that queue. Each has
+    its own app: a worker's queue selection is stored on its app.
+    """
+    started = []
+    try:
+        for queue, count in concurrency.items():
+            app, _ = benchmark_app([queue], finished)
+            ready = threading.Event()
+            worker = app.WorkController(
+                queues=[queue], concurrency=count, pool='threads',
+                hostname=f'{queue}@queueing-benchmark', loglevel='ERROR',
+                without_heartbeat=True, without_mingle=True, without_gossip=True,
+                ready_callback=lambda consumer, ready=ready: ready.set(),
+            )
+            thread = threading.Thread(target=worker.start, daemon=True)
+            thread.start()
+            started.append((worker, thread))
+            # Traffic starts once every worker consumes, so startup is not measured
+            ready.wait(10)
+        yield
+    finally:
+        for worker, _ in started:
+            worker.stop(in_sighandler=False)
+        for _, thread in started:
+            thread.join(10)
+
+def run_scenario(jobs, routed, scenario):
+    """
+    Publish jobs at their arrival times and wait for the workers to finish
+    them. Routed runs go through `routing.dispatch` to per-queue workers with
+    `DOCUMENT_QUEUES` concurrency; unrouted runs share one queue and all the
+    workers. Returns latencies (queueing plus extraction) by job kind.
+    """
+    queues = {name: options['concurrency'] for name, options in settings.DOCUMENT_QUEUES.items()}
+    if not routed:
+        queues = {SHARED_QUEUE: sum(queues.values())}
+    finished = {}
+    submitted = {}
+    app, task = benchmark_app(queues, finished)
+    documents = {path: Document(file_size=os.path.getsize(path)) for path in {job.path for job in jobs}}
+
+    with setup_default_app(app):
+        # Worker threads look tasks up on the default app; every benchmark
+        # app registers the same task
+        app.set_current()
+        app.set_default()
+        with workers(queues, finished):
+            started = time.perf_counter()
+            for index, job in enumerate(jobs):
+                time.sleep(max(0, started + job.arrival - time.perf_counter()))
+                submitted[index] = time.perf_counter()
+                document = documents[job.path]
+                if routed:
+                    # Tenants are named per scenario so usage does not carry over
+                    routing.dispatch(task, document, job.path, index, tenant=f'{scenario}:{job.tenant}')
+                else:
+                    task.apply_async((str(document.id), job.path, index), queue=SHARED_QUEUE)
+            deadline = time.perf_counter() + DRAIN_TIMEOUT
+            while len(finished) < len(jobs) and time.perf_counter() < deadline:
+                time.sleep(0.01)
+
+    latencies = {}
+    for index, job in enumerate(jobs):
+        if index in finished:
+            latencies.setdefault(job.kind, []).append(finished[index] - submitted[index])
+    return latencies
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def write_corpus(directory, size_mb):
+    paths = {'small': os.path.join(directory, 'small.pdf'), 'large': os.path.join(directory, f'large-{size_mb}mb.pdf')}
+    if not os.path.exists(paths['small']):
+        write_pdf(paths['small'], synthetic_text(SMALL_DOCUMENT_BYTES))
+    if not os.path.exists(paths['large']):
+        write_pdf(paths['large'], synthetic_text(int(size_mb * 1024 * 1024), seed=1))
+    return paths
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_SIZES_MB, duration=DURATION, burst=BURST_SIZE):
+    """
+    Latency of small documents with and without a burst of large ones,
+    for a single shared queue and for cost-routed queues. Each scenario
+    runs real workers for `duration` seconds of traffic with `repeat`
+    random seeds, and the worst value is reported.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = corpus_dir or scratch
+        os.makedirs(directory, exist_ok=True)
+        for size in sizes_mb:
+            paths = write_corpus(directory, size)
+            for routed in (False, True):
+                for heavy in (False, True):
+                    scenario = f"{'routed' if routed else 'shared'}-{'loaded' if heavy else 'idle'}-{size}mb"
+                    worst = {}
+                    for seed in range(repeat):
+                        jobs = generate_jobs(paths, heavy, seed, duration, burst)
+                        latencies = run_scenario(jobs, routed, f'{scenario}-{seed}')
+                        for kind, values in latencies.items():
+                            for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+                                key = (kind, label)
+                                worst[key] = max(worst.get(key, 0), percentile(values, fraction))
+                    for (kind, label), seconds in sorted(worst.items()):
+                        results.append({'name': f'{scenario}/{kind}-{label}', 'bytes': os.path.getsize(paths[kind.split('-')[-1]]), 'seconds': seconds, 'peak_memory': 0})
+    return results
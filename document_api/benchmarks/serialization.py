@@ -0,0 +1,75 @@
+import random
+import tempfile
+import uuid
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from . import measure
+from .pipeline import throwaway_database
+from ..models import Document
+from ..renderers import render
+from ..serializers import DocumentRowSerializer, DocumentSerializer
+
+# Rows per listing
+DEFAULT_ROWS = (20, 1000, 10000)
+STATUSES = ('completed', 'modified', 'no_changes', 'failed')
+
+def stage_seconds(rng):
+    """Stage time as metrics.stage records it, from a millisecond to a few seconds"""
+    return round(10 ** rng.uniform(-3, 0.5), 6)
+
+def make_documents(count, seed=0):
+    """Documents shaped like real ones: metrics for both runs, about half of them modified"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    documents = []
+    for index in range(count):
+        status = STATUSES[index % len(STATUSES)]
+        metrics = {
+            'process': {
+                'stages': {'extract': stage_seconds(rng), 'analyze': stage_seconds(rng)},
+                'bytes_in': rng.randrange(10_000, 10_000_000), 'pages': rng.randrange(1, 200),
+            }
+        }
+        modified = status == 'modified'
+        if modified:
+            metrics['modify'] = {'stages': {'rewrite': stage_seconds(rng), 'render': stage_seconds(rng)}}
+        documents.append(Document(
+            file=f'documents/{uuid.uuid4()}.pdf', original_filename=f'report-{index} résumé.pdf',
+            file_size=rng.randrange(10_000, 10_000_000), content_type='application/pdf', status=status,
+            processed_at=now, modified_file=f'documents/modified/modified_{uuid.uuid4()}.pdf' if modified else None,
+            modification_guidelines='Fix grammar and tighten the wording' if modified else None,
+            modified_at=now if modified else None, processing_metrics=metrics,
+        ))
+    Document.objects.bulk_create(documents, batch_size=1000)
+
+def drf_listing(documents):
+    return JSONRenderer().render(DocumentSerializer(documents, many=True).data)
+
+def fast_listing(rows):
+    return render(DocumentRowSerializer().serialize(rows))
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_ROWS):
+    """
+    Document listings through DocumentSerializer and JSONRenderer against
+    DocumentRowSerializer and the fast renderer, on rows already fetched
+    and with the query included. `sizes_mb` is read as row counts; both
+    outputs must be byte-identical.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch, override_settings(MEDIA_ROOT=scratch), throwaway_database():
+        make_documents(max(sizes_mb))
+        for rows in sizes_mb:
+            cases = (
+                ('drf', drf_listing, lambda: list(Document.objects.all()[:rows])),
+                ('fast', fast_listing, lambda: list(DocumentRowSerializer().values(Document.objects.all()[:rows]))),
+            )
+            outputs = []
+            for name, listing, fetch in cases:
+                stats, rendered = measure(listing, fetch(), repeat=repeat)
+                results.append({'name': f'{name}/{rows}-rows', 'bytes': len(rendered), **stats})
+                stats, _ = measure(lambda: listing(fetch()), repeat=repeat)
+                results.append({'name': f'{name}-with-query/{rows}-rows', 'bytes': len(rendered), **stats})
+                outputs.append(rendered)
+            assert outputs[0] == outputs[1], f'fast listing of {rows} rows differs from DRF output'
+    return results
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+from django.core.asgi import get_asgi_application
+from django.core.files.base import ContentFile
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from .pipeline import throwaway_database
+from .queueing import percentile
+from ..models import Document
+
+# Connections per run: pollers hitting the status view and slow downloaders
+DEFAULT_CONNECTIONS = (200, 1000)
+# New connections per second; each run lasts connections / ARRIVAL_RATE seconds
+ARRIVAL_RATE = 100
+DOWNLOAD_SHARE = 0.1
+DOWNLOAD_BYTES = 2 * 1024 * 1024
+# Bytes per second a slow client reads a download at
+CLIENT_BYTES_PER_SECOND = 512 * 1024
+# Threads of the simulated WSGI server, as for a typical threaded worker
+WSGI_THREADS = 32
+HOST = '127.0.0.1'
+
+class ConnectionCounter:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.current -= 1
+
+def build_requests(connections, document_id):
+    """(arrival offset, kind, path) at ARRIVAL_RATE, DOWNLOAD_SHARE of them downloads"""
+    every = max(1, round(1 / DOWNLOAD_SHARE))
+    requests = []
+    for index in range(connections):
+        if index % every == 0:
+            requests.append((index / ARRIVAL_RATE, 'download', f'/api/download/{document_id}/'))
+        else:
+            requests.append((index / ARRIVAL_RATE, 'status', f'/api/status/{document_id}/'))
+    return requests
+
+def run_wsgi(requests):
+    """Serve every request from a fixed thread pool; a slow client holds its thread"""
+    application = get_wsgi_application()
+    counter = ConnectionCounter()
+    latencies = {}
+
+    def handle(kind, path, accepted):
+        with counter:
+            environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': HOST}
+            setup_testing_defaults(environ)
+            statuses = []
+            body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                for chunk in body:
+                    time.sleep(len(chunk) / CLIENT_BYTES_PER_SECOND)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            assert statuses[0].startswith('200'), statuses[0]
+        return kind, time.perf_counter() - accepted
+
+    with ThreadPoolExecutor(max_workers=WSGI_THREADS) as pool:
+        started = time.perf_counter()
+        futures = []
+        for offset, kind, path in requests:
+            time.sleep(max(0, started + offset - time.perf_counter()))
+            futures.append(pool.submit(handle, kind, path, time.perf_counter()))
+        for future in futures:
+            kind, latency = future.result()
+            latencies.setdefault(kind, []).append(latency)
+    return latencies, counter.peak
+
+def run_asgi(requests):
+    """Serve every request as a task on one event loop; slow clients only await"""
+    application = get_asgi_application()
+    counter = ConnectionCounter()
+
+    async def handle(offset, kind, path, started):
+        await asyncio.sleep(max(0, started + offset - time.perf_counter()))
+        accepted = time.perf_counter()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': 'GET', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': [(b'host', HOST.encode())], 'server': (HOST, 80), 'client': (HOST, 50000),
+        }
+        statuses = []
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif message.get('body'):
+                await asyncio.sleep(len(message['body']) / CLIENT_BYTES_PER_SECOND)
+
+        with counter:
+            await application(scope, receive, send)
+        assert statuses[0] == 200, statuses[0]
+        return kind, time.perf_counter() - accepted
+
+    async def serve():
+        started = time.perf_counter()
+        return await asyncio.gather(*(handle(offset, kind, path, started) for offset, kind, path in requests))
+
+    latencies = {}
+    for kind, latency in asyncio.run(serve()):
+        latencies.setdefault(kind, []).append(latency)
+    return latencies, counter.peak
+
+def run(corpus_dir=None, repeat=3, sizes_mb=DEFAULT_CONNECTIONS):
+    """
+    Status polls and slow downloads arriving at ARRIVAL_RATE, served
+    through the WSGI and ASGI handlers in process. `sizes_mb` is read as
+    the numbers of connections per run; the best of `repeat` runs is kept.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as scratch, override_settings(MEDIA_ROOT=scratch), throwaway_database():
+        document = Document.objects.create(
+            original_filename='served.pdf', file_size=DOWNLOAD_BYTES, content_type='application/pdf', status='modified'
+        )
+        document.modified_file.save('served.pdf', ContentFile(os.urandom(DOWNLOAD_BYTES)))
+
+        for connections in sizes_mb:
+            requests = build_requests(connections, document.id)
+            for server, serve in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+                best = {}
+                peak = 0
+                for _ in range(repeat):
+                    latencies, run_peak = serve(requests)
+                    peak = max(peak, run_peak)
+                    for kind, values in latencies.items():
+                        for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+                            key = (kind, label)
+                            best[key] = min(best.get(key, float('inf')), percentile(values, fraction))
+                for (kind, label), seconds in sorted(best.items()):
+                    results.append({
+                        'name': f'{server}-{connections}/{kind}-{label}', 'bytes': 0, 'seconds': seconds,
+                        'peak_memory': 0, 'connections': peak,
+                    })
+    return results
@@ -0,0 +1,147 @@
+import hashlib
+from collections import namedtuple
+from functools import cached_property
+from django.conf import settings
+from django.db import transaction
+from .models import DocumentChange
+
+# One edit: `length` characters of the original at `offset` become `replacement`
+Change = namedtuple('Change', ['offset', 'length', 'replacement', 'rule'])
+
+class SpanText:
+    """
+    Text rewritten by successive replacements that remembers, for every
+    piece, where it came from in the original or which rule inserted it.
+    Replacements of replaced text are folded into one change.
+    """
+
+    def __init__(self, text):
+        self.original = text
+        self.text = text
+        # (text, offset in the original or None if inserted, rule index)
+        self.segments = [(text, 0, None)]
+
+    def replace(self, matches, rule):
+        """Apply (start, end, replacement) matches over the current text, in order and not overlapping"""
+        segments = []
+        pieces = iter(self.segments)
+        piece = next(pieces, None)
+        start = 0  # position of `piece` in the current text
+
+        def keep_until(position):
+            # Copy pieces up to `position`, splitting the one that straddles it
+            nonlocal piece, start
+            while piece is not None and start + len(piece[0]) <= position:
+                if piece[0] or piece[1] is None:
+                    segments.append(piece)
+                start += len(piece[0])
+                piece = next(pieces, None)
+            if piece is not None and start < position:
+                text, offset, piece_rule = piece
+                head = position - start
+                segments.append((text[:head], offset, piece_rule))
+                piece = (text[head:], None if offset is None else offset + head, piece_rule)
+                start = position
+
+        def drop_until(position):
+            nonlocal piece, start
+            # Empty pieces mark deletions; one right at the end of the match stays
+            while piece is not None and start + len(piece[0]) <= position and (piece[0] or start < position):
+                start += len(piece[0])
+                piece = next(pieces, None)
+            if piece is not None and start < position:
+                text, offset, piece_rule = piece
+                tail = position - start
+                piece = (text[tail:], None if offset is None else offset + tail, piece_rule)
+                start = position
+
+        for match_start, match_end, replacement in matches:
+            keep_until(match_start)
+            drop_until(match_end)
+            segments.append((replacement, None, rule))
+        while piece is not None:
+            segments.append(piece)
+            piece = next(pieces, None)
+        self.segments = segments
+        self.text = ''.join(segment[0] for segment in segments)
+
+    def changes(self):
+        """The (offset, length, replacement, rule index) spans turning the original into the text"""
+        changes = []
+        position = 0
+        inserted = []
+        rules = []
+        for text, offset, rule in self.segments + [('', len(self.original), None)]:
+            if offset is None:
+                inserted.append(text)
+                rules.append(rule)
+                continue
+            if inserted:
+                new = ''.join(inserted)
+                # A later rule may have put back exactly what an earlier one replaced
+                if new != self.original[position:offset]:
+                    changes.append(Change(position, offset - position, new, max(rules)))
+                inserted = []
+                rules = []
+            position = offset + len(text)
+        return tuple(changes)
+
+def iter_applied(original, changes):
+    """Yield the pieces of `original` with the ordered changes applied"""
+    position = 0
+    for change in changes:
+        yield original[position:change.offset]
+        yield change.replacement
+        position = change.offset + change.length
+    yield original[position:]
+
+class ChangeSet:
+    """
+    The edits of one rewrite as ordered spans over the original text.
+    The modified text is only assembled when something asks for it.
+    """
+
+    def __init__(self, original, changes, rules=(), fingerprint=''):
+        self.original = original
+        self.changes = tuple(changes)
+        # Messages of the rules that changed the text, in rule order
+        self.rules = tuple(rules)
+        # Fingerprint of the rule packs that produced the changes
+        self.fingerprint = fingerprint
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def iter_text(self):
+        return iter_applied(self.original, self.changes)
+
+    @cached_property
+    def text(self):
+        return ''.join(self.iter_text())
+
+    def digest(self):
+        """SHA-256 of the modified text, computed without assembling it"""
+        digest = hashlib.sha256()
+        for piece in self.iter_text():
+            digest.update(piece.encode('utf-8'))
+        return digest.hexdigest()
+
+def store(document, change_set):
+    """Replace the stored changes of a document with those of its latest modification"""
+    rows = (
+        DocumentChange(
+            document=document, position=position, offset=change.offset, length=change.length,
+            original=change_set.original[change.offset:change.offset + change.length],
+            replacement=change.replacement, rule=change.rule,
+        )
+        for position, change in enumerate(change_set)
+    )
+    with transaction.atomic():
+        DocumentChange.objects.filter(document=document).delete()
+        DocumentChange.objects.bulk_create(rows, batch_size=settings.CHANGESET_BATCH_SIZE)
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import shutil
+from django.conf import settings
+from django.core.files.storage import default_storage
+from . import idempotency
+from .models import document_upload_path
+from .uploads import INVALID_TYPE, is_document, sniff_content_type
+
+PART_SUFFIX = '.part'
+# Bytes read per call when streaming a chunk in or hashing the assembled file
+READ_BLOCK = 1024 * 1024
+# Enough of the first part for signature sniffing
+SNIFF_BYTES = 1024
+
+class ChunkError(ValueError):
+    pass
+
+def session_lock(session_id):
+    """Held while a chunk is written and while an upload is completed, aborted or collected"""
+    return idempotency.Lock(f'upload-session:{session_id}', settings.DOCUMENT_LOCK_TIMEOUT)
+
+def session_dir(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, str(session.id))
+
+def part_path(session, offset):
+    return os.path.join(session_dir(session), f'{offset:020d}{PART_SUFFIX}')
+
+def list_parts(session):
+    """(offset, path, size) of every stored part, in offset order"""
+    directory = session_dir(session)
+    if not os.path.isdir(directory):
+        return []
+    parts = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(PART_SUFFIX):
+                parts.append((int(entry.name[:-len(PART_SUFFIX)]), entry.path, entry.stat().st_size))
+    return sorted(parts)
+
+def received_bytes(session):
+    """Length of the contiguous run of parts from offset 0, where an upload resumes"""
+    received = 0
+    for offset, _, size in list_parts(session):
+        if offset != received:
+            break
+        received += size
+    return received
+
+def write_part(session, offset, stream, checksum):
+    """
+    Stream one chunk from `stream` into its part file, checking its size
+    and SHA-256 on the way. The part only appears once it is complete, so
+    an interrupted chunk is simply sent again.
+    """
+    os.makedirs(session_dir(session), exist_ok=True)
+    final_path = part_path(session, offset)
+    temporary_path = f'{final_path}.tmp'
+    limit = min(settings.UPLOAD_CHUNK_MAX_SIZE, session.size - offset)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(temporary_path, 'wb') as part:
+            while True:
+                block = stream.read(READ_BLOCK)
+                if not block:
+                    break
+                written += len(block)
+                if written > limit:
+                    raise ChunkError(f"Chunk exceeds {limit} bytes")
+                digest.update(block)
+                part.write(block)
+        if not written:
+            raise ChunkError("Chunk is empty")
+        if digest.hexdigest() != checksum.lower():
+            raise ChunkError("Chunk checksum mismatch")
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    os.replace(temporary_path, final_path)
+    return written
+
+def part_matches(session, offset, checksum):
+    """Whether a part already stored at `offset` has this checksum (a retried chunk)"""
+    try:
+        with open(part_path(session, offset), 'rb') as part:
+            digest = hashlib.sha256()
+            for block in iter(lambda: part.read(READ_BLOCK), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return False
+    return digest.hexdigest() == checksum.lower()
+
+def copy_range(source, destination, count):
+    """
+    Append `count` bytes from one file descriptor to another inside the
+    kernel where possible: copy_file_range, then sendfile, then plain
+    reads and writes.
+    """
+    remaining = count
+    while remaining:
+        copied = 0
+        for kernel_copy in (getattr(os, 'copy_file_range', None), _sendfile):
+            if kernel_copy is None:
+                continue
+            try:
+                copied = kernel_copy(source, destination, remaining)
+            except OSError:
+                continue
+            if copied:
+                break
+        if not copied:
+            block = os.read(source, min(remaining, READ_BLOCK))
+            if not block:
+                raise ChunkError("Part ended early")
+            copied = os.write(destination, block)
+        remaining -= copied
+
+def _sendfile(source, destination, count):
+    return os.sendfile(destination, source, None, count)
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def assemble(session):
+    """
+    Concatenate the parts of a finished upload into its final storage path
+    and verify the whole-file checksum. Returns (storage name, content type);
+    the parts are removed once the file is in place.
+    """
+    parts = list_parts(session)
+    expected = 0
+    for offset, _, size in parts:
+        if offset != expected:
+            raise ChunkError(f"Missing bytes at offset {expected}")
+        expected += size
+    if expected != session.size:
+        raise ChunkError(f"Received {expected} of {session.size} bytes")
+
+    with open(parts[0][1], 'rb') as first:
+        content_type = sniff_content_type(first.read(SNIFF_BYTES), session.content_type)
+    if content_type is None:
+        raise ChunkError(INVALID_TYPE)
+
+    storage_name = default_storage.generate_filename(document_upload_path(None, session.original_filename))
+    try:
+        path = default_storage.path(storage_name)
+    except NotImplementedError:
+        # Remote storage: assemble next to the parts and upload the result
+        path = None
+    local = path or os.path.join(session_dir(session), 'assembled')
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    destination = open(local, 'xb')
+    try:
+        with destination:
+            for _, part, size in parts:
+                with open(part, 'rb') as source:
+                    copy_range(source.fileno(), destination.fileno(), size)
+        # The parts were checked one by one; this read confirms their order and content as a whole
+        if file_checksum(local) != session.checksum.lower():
+            raise ChunkError("File checksum mismatch")
+        if not is_document(local, content_type):
+            raise ChunkError(INVALID_TYPE)
+        if path is None:
+            with open(local, 'rb') as assembled:
+                storage_name = default_storage.save(storage_name, assembled)
+    except BaseException:
+        os.unlink(local)
+        raise
+    discard(session)
+    return storage_name, content_type
+
+def discard(session):
+    """Remove every stored part of a session"""
+    shutil.rmtree(session_dir(session), ignore_errors=True)
@@ -0,0 +1,75 @@
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+PARAGRAPH = f'{W}p'
+TABLE = f'{W}tbl'
+TEXT = f'{W}t'
+TAB = f'{W}tab'
+BREAKS = (f'{W}br', f'{W}cr')
+# Text boxes are stored twice (modern and VML fallback); only read the first
+FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+DOCUMENT_PART = 'word/document.xml'
+# Parts read after the main body, in this order
+EXTRA_PARTS = (
+    re.compile(r'word/header\d*\.xml$'),
+    re.compile(r'word/footer\d*\.xml$'),
+    re.compile(r'word/footnotes\.xml$'),
+    re.compile(r'word/endnotes\.xml$'),
+)
+
+def get_text_parts(names):
+    """Story parts of a DOCX package that carry text, body first"""
+    parts = [DOCUMENT_PART] if DOCUMENT_PART in names else []
+    for pattern in EXTRA_PARTS:
+        parts.extend(sorted(name for name in names if pattern.match(name)))
+    return parts
+
+def iter_part_paragraphs(stream):
+    """
+    Yield the text of each paragraph in one WordprocessingML part.
+
+    Processed elements are cleared from their parent as soon as a block
+    ends, so memory stays constant however long the part is.
+    """
+    path = []
+    paragraphs = []
+    skipping = 0
+    for event, element in iterparse(stream, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            path.append(element)
+            if tag == FALLBACK:
+                skipping += 1
+            elif tag == PARAGRAPH and not skipping:
+                paragraphs.append([])
+            continue
+
+        path.pop()
+        if tag == FALLBACK:
+            skipping -= 1
+        elif skipping or not paragraphs:
+            pass
+        elif tag == TEXT:
+            paragraphs[-1].append(element.text or '')
+        elif tag == TAB:
+            paragraphs[-1].append('\t')
+        elif tag in BREAKS:
+            paragraphs[-1].append('\n')
+        elif tag == PARAGRAPH:
+            yield ''.join(paragraphs.pop())
+
+        if tag in (PARAGRAPH, TABLE) and not paragraphs and path:
+            path[-1].clear()
+
+def iter_docx_paragraphs(file_path):
+    """Stream paragraphs from the body, headers, footers and notes of a DOCX file"""
+    with zipfile.ZipFile(file_path) as archive:
+        names = set(archive.namelist())
+        if DOCUMENT_PART not in names:
+            raise ValueError(f"{DOCUMENT_PART} missing from package")
+        for part in get_text_parts(names):
+            with archive.open(part) as stream:
+                yield from iter_part_paragraphs(stream)
@@ -0,0 +1,266 @@
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from . import chunked_uploads, page_store
+from .models import SETTLED_STATUSES, Document, UploadSession
+from .storage import COMPRESSED_SUFFIX, cold_storage
+
+# Top-level directory under each storage root that holds document files
+DOCUMENTS_DIRECTORY = 'documents'
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second; no limit when rate is falsy"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+class Report:
+    """Counts of one collection run; never holds the names themselves"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.orphans = 0
+        self.orphan_bytes = 0
+        self.expired = 0
+        self.sessions = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def iter_files(root, directory=DOCUMENTS_DIRECTORY):
+    """
+    Yield (storage name, size, mtime) for every file below root/directory.
+    Directories are walked one at a time with os.scandir, so only the stack
+    of pending directory names is kept, however many files there are.
+    """
+    pending = [directory]
+    while pending:
+        relative = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{relative}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield name, stat.st_size, stat.st_mtime
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def stored_name(name):
+    """The name a document row holds for a file on disk (originals may be gzipped)"""
+    return name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name
+
+def referenced_names(names):
+    """Those of `names` some document still points at, in two indexed lookups"""
+    referenced = set(Document.objects.filter(file__in=names).values_list('file', flat=True))
+    referenced.update(Document.objects.filter(modified_file__in=names).values_list('modified_file', flat=True))
+    return referenced
+
+def local_roots():
+    """Filesystem roots of the default and cold storages; remote tiers are skipped"""
+    roots = []
+    for storage in (default_storage, cold_storage()):
+        if storage is None:
+            continue
+        try:
+            root = storage.path('')
+        except NotImplementedError:
+            continue
+        if root not in roots:
+            roots.append(root)
+    return roots
+
+def _remove(path, report, limiter, log):
+    limiter.wait()
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        report.errors += 1
+        log(f'Could not remove {path}: {e}')
+
+def _remove_orphan(root, name, size, report, limiter, log):
+    report.orphans += 1
+    report.orphan_bytes += size
+    log(f"{'Would remove' if report.dry_run else 'Removing'} orphan {name}")
+    if not report.dry_run:
+        _remove(os.path.join(root, name), report, limiter, log)
+
+def collect_orphans(root, cutoff, report, limiter, log, batch_size):
+    """
+    Remove files under root/documents that no document references: failed
+    uploads, replaced modified files and files of deleted rows. Files newer
+    than `cutoff` are left alone, as their row may not be committed yet.
+    """
+    cutoff = cutoff.timestamp()
+    candidates = ((name, size, mtime) for name, size, mtime in iter_files(root) if mtime < cutoff)
+    for batch in batched(candidates, batch_size):
+        report.scanned += len(batch)
+        referenced = referenced_names({stored_name(name) for name, _, _ in batch})
+        for name, size, _ in batch:
+            if stored_name(name) not in referenced:
+                _remove_orphan(root, name, size, report, limiter, log)
+
+def _store_document_id(name):
+    try:
+        return uuid.UUID(os.path.basename(name).removesuffix(page_store.SUFFIX))
+    except ValueError:
+        return None
+
+def collect_page_stores(root, cutoff, report, limiter, log, batch_size):
+    """Remove page stores under root/pages whose document no longer exists"""
+    cutoff = cutoff.timestamp()
+    files = iter_files(root, page_store.PAGES_DIRECTORY)
+    candidates = ((name, size, mtime) for name, size, mtime in files if mtime < cutoff)
+    for batch in batched(candidates, batch_size):
+        report.scanned += len(batch)
+        ids = {_store_document_id(name) for name, _, _ in batch} - {None}
+        existing = set(Document.objects.filter(id__in=ids).values_list('id', flat=True))
+        for name, size, _ in batch:
+            if _store_document_id(name) not in existing:
+                _remove_orphan(root, name, size, report, limiter, log)
+
+def expire_modified(cutoff, report, limiter, log, batch_size):
+    """
+    Drop modified files last written before `cutoff`. The row is cleared
+    first, so a failed delete leaves an orphan for the next run rather than
+    a row pointing at a missing file.
+    """
+    documents = Document.objects.filter(status__in=SETTLED_STATUSES, modified_at__lt=cutoff).exclude(
+        modified_file=''
+    ).exclude(modified_file__isnull=True).order_by('id')
+    last_id = None
+    while True:
+        page = documents if last_id is None else documents.filter(id__gt=last_id)
+        batch = list(page.values_list('id', 'modified_file')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        for document_id, name in batch:
+            report.expired += 1
+            log(f"{'Would expire' if report.dry_run else 'Expiring'} {name}")
+            if report.dry_run:
+                continue
+            cleared = Document.objects.filter(id=document_id, modified_file=name).update(
+                modified_file='', modified_text_hash='', modified_tier='hot'
+            )
+            if cleared:
+                limiter.wait()
+                try:
+                    default_storage.delete(name)
+                except OSError as e:
+                    report.errors += 1
+                    log(f'Could not remove {name}: {e}')
+
+def _remove_session(root, name, session_id, report, limiter, log):
+    """Remove a part directory under its upload lock, unless its upload is still active"""
+    lock = chunked_uploads.session_lock(name)
+    if not lock.acquire():
+        return
+    try:
+        # An upload resumed since its batch was read, or busy while idle
+        # sessions were aborted, keeps its parts
+        if session_id is not None and UploadSession.objects.filter(id=session_id, status='active').exists():
+            return
+        report.sessions += 1
+        log(f"Removing upload session {name}")
+        _remove(os.path.join(root, name), report, limiter, log)
+    finally:
+        lock.release()
+
+def collect_upload_sessions(cutoff, report, limiter, log, batch_size):
+    """
+    Abort chunked uploads idle since `cutoff` and remove part directories
+    that no active session owns. Each session is aborted and its directory
+    removed under its upload lock, so a chunk or completion in flight is
+    never pulled out from under its request.
+    """
+    if not report.dry_run:
+        idle = UploadSession.objects.filter(status='active', updated_at__lt=cutoff).values_list('id', flat=True)
+        for session_id in idle.iterator(chunk_size=batch_size):
+            lock = chunked_uploads.session_lock(session_id)
+            if not lock.acquire():
+                # A request holds the upload, so it is not idle
+                continue
+            try:
+                UploadSession.objects.filter(id=session_id, status='active', updated_at__lt=cutoff).update(status='aborted')
+            finally:
+                lock.release()
+    root = settings.UPLOAD_SESSION_ROOT
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return
+    with entries:
+        for batch in batched((entry.name for entry in entries if entry.is_dir(follow_symlinks=False)), batch_size):
+            ids = {}
+            for name in batch:
+                try:
+                    ids[name] = uuid.UUID(name)
+                except ValueError:
+                    pass
+            active = {
+                str(session_id) for session_id in UploadSession.objects.filter(
+                    id__in=ids.values(), status='active', updated_at__gte=cutoff
+                ).values_list('id', flat=True)
+            }
+            for name in batch:
+                if name in active:
+                    continue
+                if report.dry_run:
+                    report.sessions += 1
+                    log(f"Would remove upload session {name}")
+                else:
+                    _remove_session(root, name, ids.get(name), report, limiter, log)
+
+def collect(dry_run=False, grace_hours=None, modified_retention_days=None, session_retention_hours=None,
+            rate=None, batch_size=None, log=None):
+    """Run every collection step with the GARBAGE_* settings as defaults; returns a Report"""
+    now = timezone.now()
+    grace_hours = settings.GARBAGE_GRACE_HOURS if grace_hours is None else grace_hours
+    if modified_retention_days is None:
+        modified_retention_days = settings.GARBAGE_MODIFIED_RETENTION_DAYS
+    if session_retention_hours is None:
+        session_retention_hours = settings.GARBAGE_UPLOAD_SESSION_RETENTION_HOURS
+    limiter = RateLimiter(settings.GARBAGE_DELETE_RATE if rate is None else rate)
+    batch_size = batch_size or settings.GARBAGE_BATCH_SIZE
+    log = log or (lambda message: None)
+    report = Report(dry_run)
+
+    if modified_retention_days:
+        expire_modified(now - timedelta(days=modified_retention_days), report, limiter, log, batch_size)
+    collect_upload_sessions(now - timedelta(hours=session_retention_hours), report, limiter, log, batch_size)
+    for root in local_roots():
+        collect_orphans(root, now - timedelta(hours=grace_hours), report, limiter, log, batch_size)
+        collect_page_stores(root, now - timedelta(hours=grace_hours), report, limiter, log, batch_size)
+    return report
@@ -0,0 +1,125 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from .changeset import SpanText
+from .paragraph_memo import make_fingerprint
+from .rule_packs import get_registry, get_rule_packs
+
+# Number of distinct normalized guidelines kept compiled
+PLAN_CACHE_SIZE = 1024
+
+# Sentences longer than this are reported by the concise NLP pass
+LONG_SENTENCE_WORDS = 25
+
+# Shape of memoized rewrite results; bumped so older cached entries are not reused
+REWRITE_FORMAT = 'spans-1'
+
+# Words looked up in rule pack dictionaries
+WORD_PATTERN = re.compile(r"[\w']+")
+
+# Compiled action plan for one normalized guidelines string
+GuidelinePlan = namedtuple(
+    'GuidelinePlan',
+    ['guidelines', 'rule_sets', 'nlp_passes', 'long_sentence_words', 'generation']
+)
+
+def normalize_guidelines(guidelines):
+    """Lowercase and collapse whitespace so equivalent guidelines share a plan"""
+    return ' '.join(guidelines.lower().split())
+
+def compile_guidelines(guidelines):
+    """Turn free-text guidelines into a cached, immutable GuidelinePlan"""
+    registry = get_registry()
+    registry.packs()
+    return _compile_plan(normalize_guidelines(guidelines), registry.generation)
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile_plan(normalized, generation):
+    rule_sets = []
+    nlp_passes = []
+    for pack in get_rule_packs():
+        if any(trigger in normalized for trigger in pack.triggers):
+            rule_sets.append(pack.name)
+            nlp_passes.extend(nlp_pass for nlp_pass in pack.nlp_passes if nlp_pass not in nlp_passes)
+
+    return GuidelinePlan(
+        guidelines=normalized,
+        rule_sets=tuple(rule_sets),
+        nlp_passes=tuple(nlp_passes),
+        long_sentence_words=LONG_SENTENCE_WORDS,
+        generation=generation,
+    )
+
+def get_rule_table(packs):
+    """
+    Ordered (pattern, replacement, message, case_insensitive_check, dictionary)
+    rules. Dictionary rules have no pattern and replace whole words.
+    """
+    rules = []
+    for pack in packs:
+        for pattern, replacement in pack.rules:
+            message = pack.message.format(pattern=pattern.strip(), replacement=replacement)
+            rules.append((pattern, replacement, message, pack.case_insensitive_check, None))
+        if pack.dictionary is not None:
+            message = pack.message.format(pattern=pack.name, replacement='')
+            rules.append((None, None, message, False, pack.dictionary))
+    return tuple(rules)
+
+class RuleMatcher:
+    """Rule table for a set of rule packs, compiled once and shared"""
+
+    def __init__(self, packs):
+        self.rules = get_rule_table(packs)
+        self.messages = tuple(rule[2] for rule in self.rules)
+        self.fingerprint = make_fingerprint(
+            REWRITE_FORMAT, *(f"{pack.name}:{pack.version}:{pack.digest}" for pack in packs)
+        )
+        # One case-insensitive scan rejects paragraphs no rule can touch;
+        # dictionary lookups can match any word so they disable it
+        self.prefilter = None
+        if self.rules and all(rule[4] is None for rule in self.rules):
+            self.prefilter = re.compile(
+                '|'.join(re.escape(rule[0]) for rule in self.rules), re.IGNORECASE
+            )
+
+    def rewrite(self, paragraph):
+        """
+        Apply rules to one paragraph, returning the new text, the indices
+        of the rules that changed it and the changes as (offset, length,
+        replacement, rule index) spans over the paragraph
+        """
+        if not self.rules or (self.prefilter is not None and not self.prefilter.search(paragraph)):
+            return paragraph, (), ()
+
+        spans = SpanText(paragraph)
+        applied = []
+        for index, (pattern, replacement, message, case_insensitive_check, dictionary) in enumerate(self.rules):
+            if dictionary is not None:
+                matches = []
+                for match in WORD_PATTERN.finditer(spans.text):
+                    word = dictionary.get(match.group(0))
+                    if word is not None and word != match.group(0):
+                        matches.append((match.start(), match.end(), word))
+            else:
+                haystack = spans.text.lower() if case_insensitive_check else spans.text
+                if pattern not in haystack or pattern == replacement:
+                    continue
+                matches = []
+                start = spans.text.find(pattern)
+                while start != -1:
+                    matches.append((start, start + len(pattern), replacement))
+                    start = spans.text.find(pattern, start + len(pattern))
+            if matches:
+                spans.replace(matches, index)
+                applied.append(index)
+        return spans.text, tuple(applied), spans.changes()
+
+def get_matcher(plan):
+    """Compiled matcher shared by every plan selecting the same rule packs"""
+    return _build_matcher(plan.rule_sets, plan.generation)
+
+@lru_cache(maxsize=64)
+def _build_matcher(rule_sets, generation):
+    registry = get_registry()
+    packs = [pack for pack in registry.packs() if pack.name in rule_sets]
+    return RuleMatcher(packs)
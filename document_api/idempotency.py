@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import json
+import time
+import uuid
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+# Seconds between attempts while waiting for a lock
+LOCK_POLL_INTERVAL = 0.05
+
+# Delete the lock only if it still holds our token
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class LockTimeout(Exception):
+    pass
+
+class RedisBackend:
+    """Shared by every worker and web process using the same Redis"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+
+    def add(self, key, value, timeout):
+        return bool(self.client.set(key, value, nx=True, px=int(timeout * 1000)))
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, timeout):
+        self.client.set(key, value, px=int(timeout * 1000))
+
+    def delete_if(self, key, value):
+        self._release(keys=[key], args=[value])
+
+class CacheBackend:
+    """
+    Local fallback on the Django cache. Only as shared as the cache is:
+    with LocMemCache it covers a single process, which is enough for tests.
+    """
+
+    def add(self, key, value, timeout):
+        return cache.add(key, value, timeout)
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout)
+
+    def delete_if(self, key, value):
+        if cache.get(key) == value:
+            cache.delete(key)
+
+_backends = {}
+
+def get_backend():
+    url = settings.IDEMPOTENCY_REDIS_URL
+    if not url or redis is None:
+        return CacheBackend()
+    if url not in _backends:
+        _backends[url] = RedisBackend(url)
+    return _backends[url]
+
+def redis_client():
+    """The Redis client of IDEMPOTENCY_REDIS_URL, for other state every process shares; None without one"""
+    return getattr(get_backend(), 'client', None)
+
+class Lock:
+    """A named lock with an expiry, so a crashed holder cannot block forever"""
+
+    def __init__(self, name, timeout, token=None):
+        self.name = f'lock:{name}'
+        self.timeout = timeout
+        # Passing a holder's token lets another process release its lock
+        self.token = token or uuid.uuid4().hex
+        self.backend = get_backend()
+
+    def acquire(self, wait=0):
+        deadline = time.monotonic() + wait
+        while True:
+            if self.backend.add(self.name, self.token, self.timeout):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def release(self):
+        self.backend.delete_if(self.name, self.token)
+
+def serialized(kind):
+    """
+    Run a task for one document at a time across all workers. A second run
+    waits up to DOCUMENT_LOCK_WAIT seconds for the first to finish.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(document_id, *args, **kwargs):
+            lock = Lock(f'document-{kind}:{document_id}', settings.DOCUMENT_LOCK_TIMEOUT)
+            if not lock.acquire(wait=settings.DOCUMENT_LOCK_WAIT):
+                raise LockTimeout(f"Document {document_id} is busy with another {kind} run")
+            try:
+                return func(document_id, *args, **kwargs)
+            finally:
+                lock.release()
+        return wrapper
+    return decorator
+
+def client_key(request):
+    return request.META.get(HEADER, '').strip()[:MAX_KEY_LENGTH]
+
+def make_key(scope, client_key, *parts):
+    """
+    The client's key, or one derived from the request content so identical
+    submissions collapse without one
+    """
+    if client_key:
+        return f'{scope}:client:{client_key}'
+    digest = hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'{scope}:{digest}'
+
+def get_key(request, scope, *parts):
+    """The key of a request from its Idempotency-Key header or its content"""
+    return make_key(scope, client_key(request), *parts)
+
+def get_response(key):
+    """(data, status) stored for a completed request, or None"""
+    stored = get_backend().get(f'idempotency:{key}')
+    if stored is None:
+        return None
+    stored = json.loads(stored)
+    return stored['data'], stored['status']
+
+def save_response(key, data, status):
+    payload = json.dumps({'data': data, 'status': status}, default=str)
+    get_backend().set(f'idempotency:{key}', payload, settings.IDEMPOTENCY_TTL)
+
+def begin(key):
+    """Claim a key for the request being handled; None if another request holds it"""
+    lock = Lock(f'idempotency:{key}', settings.DOCUMENT_LOCK_TIMEOUT)
+    return lock if lock.acquire() else None
+
+def claim(key, token):
+    """The claim begin() took on `key`, for the process that finishes the request"""
+    return Lock(f'idempotency:{key}', settings.DOCUMENT_LOCK_TIMEOUT, token)
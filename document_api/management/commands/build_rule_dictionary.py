@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from document_api.rule_packs import build_dictionary
+
+class Command(BaseCommand):
+    help = 'Compile a tab-separated word list into a memory-mapped rule dictionary (.rpd)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='TSV file with one "word<TAB>replacement" pair per line')
+        parser.add_argument('output', help='Path of the .rpd file to write, next to its rule pack')
+
+    def handle(self, *args, **options):
+        if not options['output'].endswith('.rpd'):
+            raise CommandError('Output file must have the .rpd extension')
+
+        def read_entries():
+            with open(options['source'], encoding='utf-8') as source:
+                for line_number, line in enumerate(source, 1):
+                    line = line.rstrip('\n')
+                    if not line or line.startswith('#'):
+                        continue
+                    try:
+                        word, replacement = line.split('\t', 1)
+                    except ValueError:
+                        raise CommandError(f'Line {line_number} is not "word<TAB>replacement"')
+                    yield word, replacement
+
+        count = build_dictionary(read_entries(), options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Wrote {count} entries to {options["output"]}')
+        )
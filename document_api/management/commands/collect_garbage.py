@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from document_api import garbage
+
+class Command(BaseCommand):
+    help = 'Remove unreferenced document files, expired modified files and stale upload sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=settings.GARBAGE_GRACE_HOURS,
+                            help='Hours an unreferenced file is kept, covering uploads still in flight')
+        parser.add_argument('--modified-retention', type=int, default=settings.GARBAGE_MODIFIED_RETENTION_DAYS,
+                            help='Days modified files are kept (default: forever)')
+        parser.add_argument('--session-retention', type=float, default=settings.GARBAGE_UPLOAD_SESSION_RETENTION_HOURS,
+                            help='Hours an idle chunked upload is kept')
+        parser.add_argument('--rate', type=float, default=settings.GARBAGE_DELETE_RATE,
+                            help='Deletes per second (0 for no limit)')
+        parser.add_argument('--batch-size', type=int, default=settings.GARBAGE_BATCH_SIZE,
+                            help='Files checked against the database per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 or options['dry_run'] else None
+        report = garbage.collect(
+            dry_run=options['dry_run'],
+            grace_hours=options['grace'],
+            modified_retention_days=options['modified_retention'],
+            session_retention_hours=options['session_retention'],
+            rate=options['rate'],
+            batch_size=options['batch_size'],
+            log=log,
+        )
+        action = 'Would remove' if report.dry_run else 'Removed'
+        summary = (
+            f'{action} {report.orphans} orphaned files ({report.orphan_bytes / (1024 * 1024):.1f} MB of '
+            f'{report.scanned} checked), {report.expired} expired modified files and '
+            f'{report.sessions} upload sessions'
+        )
+        if report.errors:
+            self.stdout.write(self.style.WARNING(f'{summary}; {report.errors} could not be removed'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
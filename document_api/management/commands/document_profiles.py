@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from document_api.models import DocumentProfile
+
+class Command(BaseCommand):
+    help = 'List the slowest profiled document runs or dump one profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of profiles to list')
+        parser.add_argument('--document', help='Only list profiles of this document ID')
+        parser.add_argument('--kind', choices=['process', 'modify'], help='Only list profiles of this run kind')
+        parser.add_argument('--dump', type=int, metavar='PROFILE_ID', help='Print the report of one profile')
+        parser.add_argument('--output', help='Write the dumped report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['dump']:
+            try:
+                profile = DocumentProfile.objects.get(id=options['dump'])
+            except DocumentProfile.DoesNotExist:
+                raise CommandError(f"Profile {options['dump']} not found")
+            if options['output']:
+                with open(options['output'], 'w') as output:
+                    output.write(profile.report)
+                self.stdout.write(self.style.SUCCESS(f"Profile {profile.id} written to {options['output']}"))
+            else:
+                self.stdout.write(profile.report)
+            return
+
+        profiles = DocumentProfile.objects.select_related('document').defer('report')
+        if options['document']:
+            profiles = profiles.filter(document_id=options['document'])
+        if options['kind']:
+            profiles = profiles.filter(kind=options['kind'])
+
+        count = 0
+        for profile in profiles.order_by('-duration')[:options['top']]:
+            count += 1
+            self.stdout.write(
+                f"{profile.id:>6}  {profile.duration:8.2f}s  {profile.kind:<8} {profile.trigger:<8} "
+                f"{profile.profiler:<9} {profile.document_id}  {profile.document.original_filename}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Listed {count} profiles'))
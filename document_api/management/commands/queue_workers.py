@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from document_api.routing import worker_command
+
+class Command(BaseCommand):
+    help = 'Print the Celery worker command for each document queue, tuned from DOCUMENT_QUEUES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', help='Queues to print (default: all)')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or list(settings.DOCUMENT_QUEUES)
+        for queue in queues:
+            if queue not in settings.DOCUMENT_QUEUES:
+                raise CommandError(f'Unknown queue {queue!r}')
+            self.stdout.write(worker_command(queue))
@@ -0,0 +1,78 @@
+import json
+import platform
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from document_api.benchmarks import compare, database, docx, legacy_doc, pages, pipeline, queueing, serialization, serving
+
+SUITES = {
+    'database': database.run,
+    'doc': legacy_doc.run,
+    'docx': docx.run,
+    'pages': pages.run,
+    'pipeline': pipeline.run,
+    'queueing': queueing.run,
+    'serialization': serialization.run,
+    'serving': serving.run,
+}
+
+class Command(BaseCommand):
+    help = 'Run document pipeline benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES), help='Benchmark suite to run')
+        parser.add_argument('--corpus', help='Directory of real files to benchmark instead of a synthetic corpus')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per file (best is reported)')
+        parser.add_argument('--sizes', type=int, nargs='+', help='Synthetic file sizes in MB, e.g. 1 10 100 (connection counts for serving, threads for database, rows for serialization, pages for pages)')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown or memory growth over the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        kwargs = {'corpus_dir': options['corpus'], 'repeat': options['repeat']}
+        if options['sizes']:
+            kwargs['sizes_mb'] = options['sizes']
+        results = SUITES[options['suite']](**kwargs)
+
+        for result in results:
+            size_mb = result['bytes'] / (1024 * 1024)
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{result['name']:<40} {size_mb:8.2f} MB  failed: {result['error']}"))
+                continue
+            throughput = f"{size_mb / result['seconds']:8.1f} MB/s" if result['bytes'] and result['seconds'] else ' ' * 13
+            line = (
+                f"{result['name']:<40} {size_mb:8.2f} MB  {result['seconds'] * 1000:10.1f} ms  "
+                f"{throughput}  peak {result['peak_memory'] / 1024:10.1f} KB"
+            )
+            if 'connections' in result:
+                line += f"  {result['connections']:6d} concurrent connections"
+            if 'ops_per_second' in result:
+                line += f"  {result['ops_per_second']:8.1f} ops/s  {result['errors']:4d} errors"
+            self.stdout.write(line)
+
+        report = {
+            'suite': options['suite'],
+            'created_at': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = compare(results, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"Regression in {regression['name']} {regression['metric']}: "
+                    f"{regression['baseline']:.4g} -> {regression['current']:.4g}"
+                ))
+            if regressions:
+                raise CommandError(f'{len(regressions)} benchmark regressions over {options["threshold"]:.0%}')
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(results)} results'))
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from document_api.models import SETTLED_STATUSES, Document
+from document_api.storage import cold_storage
+
+class Command(BaseCommand):
+    help = 'Compress cold originals and move old, unread modified files to the cold tier'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compress-after', type=int, default=settings.STORAGE_COMPRESS_ORIGINALS_AFTER_DAYS,
+                            help='Days after upload before an original is compressed')
+        parser.add_argument('--cold-after', type=int, default=settings.STORAGE_COLD_AFTER_DAYS,
+                            help='Days after modification before a modified file may move to the cold tier')
+        parser.add_argument('--idle', type=int, default=settings.STORAGE_COLD_IDLE_DAYS,
+                            help='Days without a download before a modified file may move to the cold tier')
+        parser.add_argument('--limit', type=int, default=1000, help='Documents handled per step')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        compressed = self.compress_originals(now - timedelta(days=options['compress_after']), options)
+        moved = self.move_modified(now - timedelta(days=options['cold_after']), now - timedelta(days=options['idle']), options)
+        self.stdout.write(
+            self.style.SUCCESS(f'Compressed {compressed} originals, moved {moved} modified files to the cold tier')
+        )
+
+    def compress_originals(self, cutoff, options):
+        documents = Document.objects.filter(
+            status__in=SETTLED_STATUSES, uploaded_at__lt=cutoff, original_archived_at__isnull=True
+        ).only('id', 'file')[:options['limit']]
+        count = 0
+        for document in documents:
+            storage = document.file.storage
+            name = document.file.name
+            if options['dry_run']:
+                self.stdout.write(f'Would compress {name}')
+                continue
+            if hasattr(storage, 'compress') and not storage.is_compressed(name) and storage.exists(name):
+                if storage.compress(name):
+                    count += 1
+                    self.stdout.write(f'Compressed {name}')
+            # Incompressible files are marked too, so they are not read again next run
+            Document.objects.filter(id=document.id).update(original_archived_at=timezone.now())
+        return count
+
+    def move_modified(self, cutoff, idle_cutoff, options):
+        if not options['dry_run'] and cold_storage() is None:
+            raise CommandError("STORAGES has no 'cold' tier")
+        documents = Document.objects.filter(
+            status__in=SETTLED_STATUSES, modified_tier='hot', modified_at__lt=cutoff
+        ).exclude(modified_file='').exclude(modified_file__isnull=True).exclude(
+            modified_accessed_at__gte=idle_cutoff
+        ).only('id', 'modified_file')[:options['limit']]
+        count = 0
+        for document in documents:
+            name = document.modified_file.name
+            if options['dry_run']:
+                self.stdout.write(f'Would move {name}')
+                continue
+            document.modified_file.storage.move_to_cold(name)
+            # A document modified again meanwhile points at a new hot file
+            Document.objects.filter(id=document.id, modified_file=name).update(modified_tier='cold')
+            count += 1
+            self.stdout.write(f'Moved {name}')
+        return count
@@ -0,0 +1,234 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (content_type, per-document values) for the run currently being collected
+_current = contextvars.ContextVar('document_metrics', default=None)
+_registry = []
+# This process's file name under METRICS_MULTIPROCESS_DIR; random so a
+# reused pid never takes over the counts of a process that has exited
+_process_file = None
+# Keeps one thread's older snapshot from replacing another's newer one
+_flush_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=('content_type',), document_key=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        # Key under which values are also summed into the per-document metrics
+        self.document_key = document_key
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _label_key(self, labels):
+        current = _current.get()
+        if 'content_type' in self.labelnames and 'content_type' not in labels:
+            labels['content_type'] = current[0] if current else ''
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def _record_document(self, amount):
+        current = _current.get()
+        if current is not None and self.document_key:
+            values = current[1]
+            values[self.document_key] = values.get(self.document_key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not settings.METRICS_ENABLED or not amount:
+            return
+        key = self._label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._record_document(amount)
+
+    def merge(self, values, value):
+        return value if values is None else values + value
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(key)} {value}'
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def observe(self, value, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def merge(self, values, value):
+        if values is None:
+            return value
+        buckets, total, count = values
+        return [[a + b for a, b in zip(buckets, value[0])], total + value[1], count + value[2]]
+
+    def render(self, values):
+        for key, (buckets, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                yield f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {bucket_count}'
+            yield f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}'
+            yield f'{self.name}_sum{_format_labels(key)} {total}'
+            yield f'{self.name}_count{_format_labels(key)} {count}'
+
+STAGE_SECONDS = Histogram(
+    'document_stage_seconds', 'Time spent in each document pipeline stage', ('stage', 'content_type')
+)
+BYTES_IN = Counter('document_bytes_in_total', 'Bytes read by text extraction', document_key='bytes_in')
+BYTES_OUT = Counter('document_bytes_out_total', 'Bytes written by document rendering', document_key='bytes_out')
+PAGES = Counter('document_pages_total', 'Pages read by text extraction', document_key='pages')
+RULE_HITS = Counter('document_rule_hits_total', 'Rule applications that changed text', document_key='rule_hits')
+CACHE_HITS = Counter('document_cache_hits_total', 'Cache hits', ('cache', 'content_type'), document_key='cache_hits')
+CACHE_MISSES = Counter('document_cache_misses_total', 'Cache misses', ('cache', 'content_type'), document_key='cache_misses')
+
+@contextmanager
+def collect(content_type=''):
+    """
+    Collect per-document metrics for one pipeline run. Yields the dict the
+    stage timings and counters of this run are summed into.
+    """
+    values = {}
+    if not settings.METRICS_ENABLED:
+        yield values
+        return
+    token = _current.set((content_type, values))
+    try:
+        yield values
+    finally:
+        _current.reset(token)
+        flush()
+
+def flush():
+    """
+    Write this process's totals to its file under METRICS_MULTIPROCESS_DIR,
+    where the process serving /metrics reads them. Runs after every
+    collected pipeline run, so a worker's file is at most one document behind.
+    """
+    global _process_file
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not directory:
+        return
+    with _flush_lock:
+        if _process_file is None:
+            _process_file = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        temporary_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump({metric.name: metric.snapshot() for metric in _registry}, file)
+            os.replace(temporary_path, os.path.join(directory, _process_file))
+        except OSError as e:
+            # Metrics never fail the document run that produced them
+            logger.warning(f"Could not write metrics to {directory}: {e}")
+            if temporary_path and os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+
+def _reset_after_fork():
+    # A forked worker starts from zero in a file of its own; its parent keeps counting its own
+    global _process_file, _flush_lock
+    _process_file = None
+    _flush_lock = threading.Lock()
+    for metric in _registry:
+        metric._lock = threading.Lock()
+        metric._values = {}
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _merged_values():
+    """Values of every metric summed over all process files in METRICS_MULTIPROCESS_DIR"""
+    flush()
+    merged = {metric.name: {} for metric in _registry}
+    metrics_by_name = {metric.name: metric for metric in _registry}
+    with os.scandir(settings.METRICS_MULTIPROCESS_DIR) as entries:
+        paths = [entry.path for entry in entries if entry.name.startswith('metrics-') and entry.name.endswith('.json')]
+    for path in paths:
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for name, items in data.items():
+            if name not in metrics_by_name:
+                continue
+            values = merged[name]
+            for key, value in items:
+                key = tuple(tuple(pair) for pair in key)
+                values[key] = metrics_by_name[name].merge(values.get(key), value)
+    return merged
+
+@contextmanager
+def stage(name):
+    """Time one pipeline stage into the histogram and the current document"""
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        current = _current.get()
+        if current is not None:
+            stages = current[1].setdefault('stages', {})
+            stages[name] = round(stages.get(name, 0) + elapsed, 6)
+
+def render_prometheus():
+    """
+    All metrics in the Prometheus text exposition format: this process's,
+    or with METRICS_MULTIPROCESS_DIR those of every web and worker process
+    """
+    merged = _merged_values() if settings.METRICS_MULTIPROCESS_DIR else None
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help_text}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if merged is not None:
+            lines.extend(metric.render(merged[metric.name]))
+        else:
+            with metric._lock:
+                lines.extend(metric.render(metric._values))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0003_alter_document_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='modified_text_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0004_document_modified_text_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='processing_metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0005_document_processing_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('trigger', models.CharField(choices=[('setting', 'Setting'), ('header', 'Request Header'), ('slow', 'Slow Stage')], max_length=20)),
+                ('profiler', models.CharField(choices=[('cprofile', 'cProfile'), ('sampling', 'Sampling')], max_length=20)),
+                ('duration', models.FloatField(db_index=True)),
+                ('report', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profiles', to='document_api.document')),
+            ],
+            options={
+                'ordering': ['-duration'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0006_documentprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='is_partial',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='partial_reason',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='modified_accessed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='modified_tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('cold', 'Cold')], default='hot', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='original_archived_at',
+            field=models.DateTimeField(blank=True, help_text='When the original was considered for compression', null=True),
+        ),
+    ]
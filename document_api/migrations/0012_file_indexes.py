@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:14
+
+import django.core.validators
+from django.db import migrations, models
+import document_api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0011_document_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(db_index=True, upload_to=document_api.models.document_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx'])]),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='modified_file',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to=document_api.models.modified_document_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx'])]),
+        ),
+    ]
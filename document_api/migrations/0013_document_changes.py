@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0012_file_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text='Order of the change within the document')),
+                ('offset', models.PositiveBigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('original', models.TextField(blank=True)),
+                ('replacement', models.TextField(blank=True)),
+                ('rule', models.CharField(max_length=255)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='document_api.document')),
+            ],
+            options={
+                'ordering': ['document', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='documentchange',
+            constraint=models.UniqueConstraint(fields=('document', 'position'), name='document_change_position'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document_api', '0013_document_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSignature',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='document_api.document')),
+                ('signature', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='changes_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Rule fingerprint of the stored change set', max_length=32),
+        ),
+        migrations.CreateModel(
+            name='SignatureBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_buckets', to='document_api.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key'], name='signature_bucket_key_idx')],
+            },
+        ),
+    ]
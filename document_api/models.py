@@ -1,19 +1,28 @@
 from django.db import models
 from django.core.validators import FileExtensionValidator
+import hashlib
 import uuid
 import os
 
+def sharded_path(directory, filename):
+    """Place a file two hash-prefix levels below `directory` (256 * 256 buckets)"""
+    digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+    return os.path.join(directory, digest[:2], digest[2:4], filename)
+
 def document_upload_path(instance, filename):
     """Generate secure upload path"""
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
-    return os.path.join('documents', filename)
+    return sharded_path('documents', filename)
 
 def modified_document_upload_path(instance, filename):
     """Generate secure upload path for modified documents"""
     ext = filename.split('.')[-1]
     filename = f"modified_{uuid.uuid4()}.{ext}"
-    return os.path.join('documents', 'modified', filename)
+    return sharded_path(os.path.join('documents', 'modified'), filename)
+
+# Statuses in which no task is reading or rewriting a document's files
+SETTLED_STATUSES = ['completed', 'failed', 'modified', 'no_changes']
 
 class Document(models.Model):
     PROCESSING_STATUS = [
@@ -25,25 +34,122 @@ class Document(models.Model):
         ('modified', 'Modified'),
         ('no_changes', 'No Changes Needed'),
     ]
+    TIERS = [
+        ('hot', 'Hot'),
+        ('cold', 'Cold'),
+    ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(
         upload_to=document_upload_path,
+        db_index=True,
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx'])]
     )
     original_filename = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField()
     content_type = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
     status = models.CharField(max_length=20, choices=PROCESSING_STATUS, default='pending')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     modified_file = models.FileField(
         upload_to=modified_document_upload_path,
-        null=True, blank=True,
+        null=True, blank=True, db_index=True,
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx'])]
     )
     modification_guidelines = models.TextField(null=True, blank=True)
     modified_at = models.DateTimeField(null=True, blank=True)
+    modified_text_hash = models.CharField(max_length=64, blank=True, default='')
+    processing_metrics = models.JSONField(default=dict, blank=True)
+    is_partial = models.BooleanField(default=False)
+    partial_reason = models.CharField(max_length=255, blank=True, default='')
+    original_archived_at = models.DateTimeField(null=True, blank=True, help_text="When the original was considered for compression")
+    modified_tier = models.CharField(max_length=10, choices=TIERS, default='hot')
+    modified_accessed_at = models.DateTimeField(null=True, blank=True)
+    changes_fingerprint = models.CharField(max_length=32, blank=True, default='', help_text="Rule fingerprint of the stored change set")
+    
+    class Meta:
+        ordering = ['-uploaded_at']
+        # Each admin filter, the filename prefix search and the newest-first order
+        # (with the primary key the changelist adds) are served from an index
+        indexes = [
+            models.Index(fields=['-uploaded_at', '-id'], name='document_uploaded_idx'),
+            models.Index(fields=['status', '-uploaded_at'], name='document_status_idx'),
+            models.Index(fields=['content_type', '-uploaded_at'], name='document_type_idx'),
+            models.Index(fields=['original_filename'], name='document_filename_idx'),
+        ]
+
+class DocumentChange(models.Model):
+    """One edit of a document's latest modification, as a span over the original text"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='changes')
+    position = models.PositiveIntegerField(help_text="Order of the change within the document")
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveIntegerField()
+    original = models.TextField(blank=True)
+    replacement = models.TextField(blank=True)
+    rule = models.CharField(max_length=255)
+    
+    class Meta:
+        ordering = ['document', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'position'], name='document_change_position'),
+        ]
+
+class DocumentSignature(models.Model):
+    """MinHash signature of a document's extracted text"""
+    document = models.OneToOneField(Document, primary_key=True, on_delete=models.CASCADE, related_name='signature')
+    signature = models.BinaryField()
+    created_at = models.DateTimeField(auto_now=True)
+
+class SignatureBucket(models.Model):
+    """One LSH band of a signature; documents sharing a key are near-duplicate candidates"""
+    key = models.BigIntegerField()
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='signature_buckets')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['key'], name='signature_bucket_key_idx'),
+        ]
+
+class DocumentProfile(models.Model):
+    TRIGGERS = [
+        ('setting', 'Setting'),
+        ('header', 'Request Header'),
+        ('slow', 'Slow Stage'),
+    ]
+    PROFILERS = [
+        ('cprofile', 'cProfile'),
+        ('sampling', 'Sampling'),
+    ]
+    
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='profiles')
+    kind = models.CharField(max_length=20)
+    trigger = models.CharField(max_length=20, choices=TRIGGERS)
+    profiler = models.CharField(max_length=20, choices=PROFILERS)
+    duration = models.FloatField(db_index=True)
+    report = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-duration']
+
+class UploadSession(models.Model):
+    STATUS = [
+        ('active', 'Active'),
+        ('complete', 'Complete'),
+        ('aborted', 'Aborted'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    checksum = models.CharField(max_length=64, help_text="SHA-256 of the whole file")
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS, default='active')
+    document = models.OneToOneField(Document, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload_session')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-uploaded_at']
\ No newline at end of file
+        ordering = ['-created_at']
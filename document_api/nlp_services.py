@@ -1,5 +1,8 @@
 import os
 import logging
+from . import metrics
+from .guidelines import compile_guidelines
+from .rule_packs import get_rule_pack
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +46,7 @@ def check_guidelines_with_openai(text, guidelines):
         logger.error(f"OpenAI error: {e}")
         return text, [f"OpenAI error: {str(e)}"]
 
-def check_guidelines_with_spacy(text, guidelines):
+def check_guidelines_with_spacy(text, plan):
     """Use spaCy for text analysis and basic modifications"""
     if not nlp:
         return text, ["spaCy not available"]
@@ -52,33 +55,36 @@ def check_guidelines_with_spacy(text, guidelines):
         doc = nlp(text)
         issues = []
         
+        # Contractions come from the same rule pack the rewrite stage uses
+        formal_pack = get_rule_pack('formal')
+        formal_fixes = dict(formal_pack.rules) if formal_pack else {}
+        
         # Basic analysis
-        if "formal" in guidelines.lower():
+        if 'contractions' in plan.nlp_passes:
             # Check for informal contractions
-            contractions = ["don't", "won't", "can't", "isn't", "aren't"]
+            contractions = formal_fixes
             for token in doc:
                 if token.text.lower() in contractions:
                     issues.append(f"Informal contraction found: {token.text}")
         
-        if "concise" in guidelines.lower():
+        if 'long_sentences' in plan.nlp_passes:
             # Check sentence length
             for sent in doc.sents:
-                if len(sent.text.split()) > 25:
+                if len(sent.text.split()) > plan.long_sentence_words:
                     issues.append(f"Long sentence detected: {sent.text[:50]}...")
         
         # Simple modifications
         modified_text = text
-        if "formal" in guidelines.lower():
-            modified_text = modified_text.replace("don't", "do not")
-            modified_text = modified_text.replace("won't", "will not")
-            modified_text = modified_text.replace("can't", "cannot")
+        if 'formal' in plan.rule_sets:
+            for informal, formal in formal_fixes.items():
+                modified_text = modified_text.replace(informal, formal)
         
         return modified_text, issues
     except Exception as e:
         logger.error(f"spaCy error: {e}")
         return text, [f"spaCy error: {str(e)}"]
 
-def check_guidelines_with_languagetool(text, guidelines):
+def check_guidelines_with_languagetool(text, plan):
     """Use LanguageTool for grammar and style checking"""
     if not grammar_tool:
         return text, ["LanguageTool not available"]
@@ -102,6 +108,7 @@ def check_guidelines_with_languagetool(text, guidelines):
 
 def process_text_with_nlp(text, guidelines):
     """Process text using available NLP services"""
+    plan = compile_guidelines(guidelines)
     results = {
         'original_text': text,
         'modified_text': text,
@@ -111,7 +118,8 @@ def process_text_with_nlp(text, guidelines):
     
     # Try OpenAI first (most comprehensive)
     if openai and os.getenv('OPENAI_API_KEY'):
-        modified_text, issues = check_guidelines_with_openai(text, guidelines)
+        with metrics.stage('nlp_openai'):
+            modified_text, issues = check_guidelines_with_openai(text, guidelines)
         results['modified_text'] = modified_text
         results['issues_found'].extend(issues)
         results['services_used'].append('OpenAI GPT')
@@ -121,12 +129,14 @@ def process_text_with_nlp(text, guidelines):
     current_text = text
     
     if nlp:
-        current_text, spacy_issues = check_guidelines_with_spacy(current_text, guidelines)
+        with metrics.stage('nlp_spacy'):
+            current_text, spacy_issues = check_guidelines_with_spacy(current_text, plan)
         results['issues_found'].extend(spacy_issues)
         results['services_used'].append('spaCy')
     
     if grammar_tool:
-        current_text, lt_issues = check_guidelines_with_languagetool(current_text, guidelines)
+        with metrics.stage('nlp_languagetool'):
+            current_text, lt_issues = check_guidelines_with_languagetool(current_text, plan)
         results['issues_found'].extend(lt_issues)
         results['services_used'].append('LanguageTool')
     
@@ -0,0 +1,296 @@
+import re
+import struct
+from array import array
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compound File Binary (OLE2) constants
+OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+NOSTREAM = 0xFFFFFFFF
+
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+# Word 97-2003 File Information Block
+WORD_IDENT = 0xA5EC
+FIB_FLAG_ENCRYPTED = 0x0100
+FIB_FLAG_WHICH_TABLE = 0x0200
+FIB_CCP_TEXT = 3
+FIB_CLX = 33
+
+# FAT sectors kept decoded at once; everything else is read on demand
+FAT_CACHE_SECTORS = 32
+# Characters decoded per read from the WordDocument stream
+TEXT_CHUNK_CHARS = 32 * 1024
+
+# Paragraph, line and page breaks become newlines, cell marks become tabs
+# and the remaining control characters (objects, field marks) are dropped
+_CONTROL_CHARACTERS = {code: None for code in range(0x20) if code not in (0x09, 0x0A)}
+_CONTROL_CHARACTERS.update({0x0D: '\n', 0x0B: '\n', 0x0C: '\n', 0x07: '\t'})
+_FIELD_MARKS = re.compile('([\x13\x14\x15])')
+
+class OLE2Error(ValueError):
+    pass
+
+def is_ole2_file(file_path):
+    """Check the compound-file signature without reading past it"""
+    with open(file_path, 'rb') as file:
+        return file.read(len(OLE2_SIGNATURE)) == OLE2_SIGNATURE
+
+class CompoundFile:
+    """
+    Minimal read-only OLE2 compound-file reader.
+
+    Only the header, the DIFAT and the directory are parsed up front; FAT
+    and mini FAT sectors are read lazily through a small cache, so memory
+    stays bounded regardless of file size.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        header = self._read_at(0, 512)
+        if len(header) < 512 or header[:8] != OLE2_SIGNATURE:
+            raise OLE2Error("Not an OLE2 compound file")
+
+        self.sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from('<H', header, 0x20)[0]
+        fat_count, directory_start = struct.unpack_from('<II', header, 0x2C)
+        self.mini_cutoff, minifat_start, minifat_count, difat_start, difat_count = struct.unpack_from(
+            '<IIIII', header, 0x38
+        )
+        if self.sector_size not in (512, 4096):
+            raise OLE2Error(f"Unsupported sector size {self.sector_size}")
+
+        file.seek(0, 2)
+        self.sector_count = max(0, file.tell() - self.sector_size) // self.sector_size
+        self._fat_cache = {}
+
+        self.fat_sectors = self._read_difat(header, fat_count, difat_start, difat_count)
+        self.entries = self._read_directory(directory_start)
+        root = self.entries[0]
+        self._mini_stream = _Stream(self, root['start'], root['size'])
+        self._minifat = _Stream(self, minifat_start, minifat_count * self.sector_size) if minifat_count else None
+
+    def _read_at(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def read_sector(self, sector, offset=0, size=None):
+        if sector >= self.sector_count:
+            raise OLE2Error(f"Sector {sector} beyond end of file")
+        size = self.sector_size - offset if size is None else size
+        return self._read_at((sector + 1) * self.sector_size + offset, size)
+
+    def _read_difat(self, header, fat_count, difat_start, difat_count):
+        per_sector = self.sector_size // 4
+        fat_sectors = [s for s in struct.unpack_from('<109I', header, 0x4C) if s < DIFSECT]
+        sector = difat_start
+        for _ in range(difat_count):
+            if sector >= DIFSECT:
+                break
+            values = struct.unpack(f'<{per_sector}I', self.read_sector(sector))
+            fat_sectors.extend(s for s in values[:-1] if s < DIFSECT)
+            sector = values[-1]
+        return fat_sectors[:fat_count]
+
+    def next_sector(self, sector):
+        """Follow one link of a FAT chain"""
+        per_sector = self.sector_size // 4
+        index, position = divmod(sector, per_sector)
+        values = self._fat_cache.get(index)
+        if values is None:
+            if index >= len(self.fat_sectors):
+                raise OLE2Error(f"Sector {sector} outside the FAT")
+            values = struct.unpack(f'<{per_sector}I', self.read_sector(self.fat_sectors[index]))
+            if len(self._fat_cache) >= FAT_CACHE_SECTORS:
+                self._fat_cache.pop(next(iter(self._fat_cache)))
+            self._fat_cache[index] = values
+        return values[position]
+
+    def next_mini_sector(self, sector):
+        """Follow one link of a mini FAT chain"""
+        if self._minifat is None:
+            raise OLE2Error("File has no mini FAT")
+        return struct.unpack('<I', self._minifat.read_at(sector * 4, 4))[0]
+
+    def _read_directory(self, start):
+        entries = []
+        directory = _Stream(self, start, None)
+        offset = 0
+        while True:
+            raw = directory.read_at(offset, 128)
+            if len(raw) < 128:
+                break
+            offset += 128
+            name_length = struct.unpack_from('<H', raw, 64)[0]
+            entry_type = raw[66]
+            start_sector, size_low, size_high = struct.unpack_from('<III', raw, 116)
+            entries.append({
+                'name': raw[:max(0, name_length - 2)].decode('utf-16-le', 'replace'),
+                'type': entry_type,
+                'start': start_sector,
+                # Version 3 files only define the low 32 bits of the size
+                'size': size_low if self.sector_size == 512 else size_low | (size_high << 32),
+            })
+        if not entries or entries[0]['type'] != STGTY_ROOT:
+            raise OLE2Error("Missing root directory entry")
+        return entries
+
+    def open_stream(self, name):
+        """Random-access reader for a top-level stream"""
+        for entry in self.entries:
+            if entry['type'] == STGTY_STREAM and entry['name'] == name:
+                if entry['size'] < self.mini_cutoff:
+                    return _Stream(self, entry['start'], entry['size'], mini=True)
+                return _Stream(self, entry['start'], entry['size'])
+        raise OLE2Error(f"Stream {name!r} not found")
+
+    def has_stream(self, name):
+        return any(entry['type'] == STGTY_STREAM and entry['name'] == name for entry in self.entries)
+
+class _Stream:
+    """Reads a stream by walking its sector chain on demand"""
+
+    def __init__(self, compound, start, size, mini=False):
+        self.compound = compound
+        self.size = size
+        self.mini = mini
+        self.sector_size = compound.mini_sector_size if mini else compound.sector_size
+        # Sector numbers resolved so far; the chain is only walked as far as reads need
+        self._chain = array('I', [start] if start < DIFSECT else [])
+        self._ended = start >= DIFSECT
+
+    def _sector(self, index):
+        limit = self.compound.sector_count * (self.compound.sector_size // self.compound.mini_sector_size if self.mini else 1)
+        while len(self._chain) <= index and not self._ended:
+            if len(self._chain) > limit:
+                raise OLE2Error("Sector chain loops")
+            current = self._chain[-1]
+            following = self.compound.next_mini_sector(current) if self.mini else self.compound.next_sector(current)
+            if following >= DIFSECT:
+                self._ended = True
+            else:
+                self._chain.append(following)
+        return self._chain[index] if index < len(self._chain) else None
+
+    def read_at(self, offset, size):
+        if self.size is not None:
+            size = max(0, min(size, self.size - offset))
+        parts = []
+        while size > 0:
+            index, position = divmod(offset, self.sector_size)
+            sector = self._sector(index)
+            if sector is None:
+                break
+            length = min(size, self.sector_size - position)
+            if self.mini:
+                data = self.compound._mini_stream.read_at(sector * self.sector_size + position, length)
+            else:
+                data = self.compound.read_sector(sector, position, length)
+            if not data:
+                break
+            parts.append(data)
+            offset += len(data)
+            size -= len(data)
+        return b''.join(parts)
+
+def _read_pieces(table_stream, fc_clx, lcb_clx):
+    """Parse the piece table (PlcPcd) from the CLX in the table stream"""
+    clx = table_stream.read_at(fc_clx, lcb_clx)
+    position = 0
+    # Skip any Prc property blocks that precede the piece table
+    while position < len(clx) and clx[position] == 0x01:
+        grpprl_size = struct.unpack_from('<h', clx, position + 1)[0]
+        position += 3 + grpprl_size
+    if position >= len(clx) or clx[position] != 0x02:
+        raise OLE2Error("Piece table not found")
+    plc_size = struct.unpack_from('<I', clx, position + 1)[0]
+    plc = clx[position + 5:position + 5 + plc_size]
+    count = (plc_size - 4) // 12
+    cps = struct.unpack_from(f'<{count + 1}I', plc, 0)
+    pieces = []
+    for i in range(count):
+        fc_value = struct.unpack_from('<I', plc, (count + 1) * 4 + i * 8 + 2)[0]
+        compressed = bool(fc_value & 0x40000000)
+        fc = fc_value & 0x3FFFFFFF
+        pieces.append((cps[i], cps[i + 1], fc // 2 if compressed else fc, compressed))
+    return pieces
+
+def _clean_text(chunk, state):
+    """
+    Map Word control characters to plain text. Field codes between 0x13
+    and 0x14 are dropped while field results are kept; `state` carries the
+    field nesting across chunk boundaries.
+    """
+    fields = state['fields']
+    if not fields and '\x13' not in chunk:
+        return chunk.translate(_CONTROL_CHARACTERS)
+
+    out = []
+    for part in _FIELD_MARKS.split(chunk):
+        if part == '\x13':
+            fields.append(True)
+        elif part == '\x14':
+            if fields:
+                fields[-1] = False
+        elif part == '\x15':
+            if fields:
+                fields.pop()
+        elif not (fields and fields[-1]):
+            out.append(part.translate(_CONTROL_CHARACTERS))
+    return ''.join(out)
+
+def iter_doc_text(file_path):
+    """
+    Stream the main document text of a Word 97-2003 (.doc) file in chunks
+    """
+    with open(file_path, 'rb') as file:
+        compound = CompoundFile(file)
+        word_stream = compound.open_stream('WordDocument')
+        fib = word_stream.read_at(0, 34)
+        if len(fib) < 34 or struct.unpack_from('<H', fib, 0)[0] != WORD_IDENT:
+            raise OLE2Error("WordDocument stream has no valid FIB")
+        flags = struct.unpack_from('<H', fib, 0x0A)[0]
+        if flags & FIB_FLAG_ENCRYPTED:
+            raise OLE2Error("Encrypted documents are not supported")
+
+        # Walk the variable-length FIB sections to the fields we need
+        position = 32
+        csw = struct.unpack('<H', word_stream.read_at(position, 2))[0]
+        position += 2 + csw * 2
+        cslw = struct.unpack('<H', word_stream.read_at(position, 2))[0]
+        rg_lw = word_stream.read_at(position + 2, cslw * 4)
+        position += 2 + cslw * 4
+        cb_rg_fc_lcb = struct.unpack('<H', word_stream.read_at(position, 2))[0]
+        if cslw <= FIB_CCP_TEXT or cb_rg_fc_lcb <= FIB_CLX:
+            raise OLE2Error("FIB too short")
+        ccp_text = struct.unpack_from('<I', rg_lw, FIB_CCP_TEXT * 4)[0]
+        fc_clx, lcb_clx = struct.unpack('<II', word_stream.read_at(position + 2 + FIB_CLX * 8, 8))
+
+        table_name = '1Table' if flags & FIB_FLAG_WHICH_TABLE else '0Table'
+        table_stream = compound.open_stream(table_name)
+
+        state = {'fields': []}
+        for cp_start, cp_end, offset, compressed in _read_pieces(table_stream, fc_clx, lcb_clx):
+            cp_end = min(cp_end, ccp_text)
+            width = 1 if compressed else 2
+            encoding = 'cp1252' if compressed else 'utf-16-le'
+            cp = cp_start
+            while cp < cp_end:
+                count = min(TEXT_CHUNK_CHARS, cp_end - cp)
+                raw = word_stream.read_at(offset + (cp - cp_start) * width, count * width)
+                if not raw:
+                    break
+                yield _clean_text(raw.decode(encoding, 'replace'), state)
+                cp += count
+            if cp_end >= ccp_text:
+                break
+
+def extract_doc_text(file_path):
+    """Extract text from a legacy Word (.doc) file"""
+    return ''.join(iter_doc_text(file_path))
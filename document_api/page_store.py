@@ -0,0 +1,98 @@
+import struct
+import zlib
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .models import sharded_path
+
+# Layout: header, then the start of each compressed page and the end of the
+# last one relative to the first page, then the pages. A range of pages is
+# one read of its offsets and one of its pages, whatever the document length.
+MAGIC = b'DPG1'
+HEADER = struct.Struct('<4sI')  # magic, page count
+OFFSET = struct.Struct('<Q')
+
+PAGES_DIRECTORY = 'pages'
+SUFFIX = '.pages'
+
+def store_name(document_id):
+    return sharded_path(PAGES_DIRECTORY, f'{document_id}{SUFFIX}')
+
+def split_pages(text, page_ends=()):
+    """
+    Pages of extracted text: at the recorded page ends for PDFs, otherwise
+    at the last line break before every PAGE_STORE_PAGE_CHARS characters
+    """
+    if page_ends:
+        starts = (0,) + tuple(page_ends[:-1])
+        return [text[start:end] for start, end in zip(starts, page_ends)]
+    size = settings.PAGE_STORE_PAGE_CHARS
+    pages = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            line_end = text.rfind('\n', start, end)
+            if line_end > start:
+                end = line_end + 1
+        pages.append(text[start:end])
+        start = end
+    return pages or ['']
+
+def build(pages):
+    """The stored bytes for a list of page texts"""
+    blocks = [zlib.compress(page.encode('utf-8'), settings.PAGE_STORE_COMPRESSION) for page in pages]
+    offsets = [0]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    return b''.join([HEADER.pack(MAGIC, len(blocks))] + [OFFSET.pack(offset) for offset in offsets] + blocks)
+
+def write(document_id, text, page_ends=()):
+    """Store a document's extracted text page by page, replacing any earlier store"""
+    name = store_name(document_id)
+    content = ContentFile(build(split_pages(text, page_ends)))
+    if hasattr(default_storage, 'replace'):
+        return default_storage.replace(name, content)
+    default_storage.delete(name)
+    return default_storage.save(name, content)
+
+def read(document_id, first, last):
+    """
+    (page count, texts of pages first..last), 1-based and clipped to the
+    document. Raises FileNotFoundError when the document has no store, or
+    only the start of one that is still being written.
+    """
+    name = store_name(document_id)
+    with default_storage.open(name, 'rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise FileNotFoundError(name)
+        magic, count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"Not a page store: {name}")
+        last = min(last, count)
+        if first > last:
+            return count, []
+        file.seek(HEADER.size + (first - 1) * OFFSET.size)
+        size = (last - first + 2) * OFFSET.size
+        raw = file.read(size)
+        if len(raw) < size:
+            raise FileNotFoundError(name)
+        offsets = [offset for offset, in OFFSET.iter_unpack(raw)]
+        file.seek(HEADER.size + (count + 1) * OFFSET.size + offsets[0])
+        data = file.read(offsets[-1] - offsets[0])
+        if len(data) < offsets[-1] - offsets[0]:
+            raise FileNotFoundError(name)
+    base = offsets[0]
+    return count, [
+        zlib.decompress(data[start - base:end - base]).decode('utf-8')
+        for start, end in zip(offsets, offsets[1:])
+    ]
+
+def read_text(document_id):
+    """A document's whole stored text, or None when it has no store"""
+    try:
+        _, pages = read(document_id, 1, 2 ** 32 - 1)
+    except FileNotFoundError:
+        return None
+    return ''.join(pages)
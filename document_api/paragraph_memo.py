@@ -0,0 +1,68 @@
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Paragraphs are the unit of reuse; this matches how modified documents are rendered
+PARAGRAPH_SEPARATOR = '\n\n'
+
+def make_fingerprint(*parts):
+    """Build a short stable fingerprint from the inputs that shape a rewrite"""
+    payload = '\x1f'.join(str(part) for part in parts)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def paragraph_key(paragraph, fingerprint):
+    """Cache key for one (paragraph, rule fingerprint) pair"""
+    digest = hashlib.sha256(paragraph.encode('utf-8')).hexdigest()
+    return f"para:{fingerprint}:{digest}"
+
+def rewrite_paragraphs(text, fingerprint, rewrite, reuse=None):
+    """
+    Rewrite text one paragraph at a time, reusing memoized results.
+
+    `rewrite` is called only for paragraphs whose (text, fingerprint) pair
+    has not been seen before. `reuse`, if given, is called once when some
+    are missing and returns more results by key, such as those of a
+    near-duplicate document. Returns the per-paragraph results in order
+    and a stats dict with the number of paragraphs and how many were reused.
+    """
+    paragraphs = text.split(PARAGRAPH_SEPARATOR)
+    keys = [paragraph_key(paragraph, fingerprint) for paragraph in paragraphs]
+
+    cached = cache.get_many(set(keys))
+    borrowed = {}
+    if reuse is not None and any(key not in cached for key in keys):
+        borrowed = reuse()
+    computed = {}
+    results = []
+    for paragraph, key in zip(paragraphs, keys):
+        result = cached.get(key)
+        if result is None:
+            result = computed.get(key)
+        if result is None:
+            result = borrowed.get(key)
+            if result is not None:
+                # Memoized again so later runs find it without the match
+                computed[key] = result
+        if result is None:
+            result = rewrite(paragraph)
+            computed[key] = result
+        results.append(result)
+
+    if computed:
+        cache.set_many(computed, timeout=settings.PARAGRAPH_MEMO_TIMEOUT)
+
+    rewritten = len([key for key in computed if key not in borrowed])
+    metrics.CACHE_HITS.inc(len(paragraphs) - len(computed), cache='paragraph')
+    metrics.CACHE_MISSES.inc(len(computed), cache='paragraph')
+    if borrowed:
+        metrics.CACHE_HITS.inc(len(computed) - rewritten, cache='near_duplicate')
+    stats = {
+        'paragraphs': len(paragraphs),
+        'reused': len(paragraphs) - rewritten,
+    }
+    logger.debug(f"Paragraph memo: reused {stats['reused']} of {stats['paragraphs']} paragraphs")
+    return results, stats
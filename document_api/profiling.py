@@ -0,0 +1,179 @@
+import cProfile
+import contextvars
+import functools
+import hmac
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth import get_user
+
+logger = logging.getLogger(__name__)
+
+# Rows kept from a cProfile report
+CPROFILE_REPORT_ROWS = 60
+# Distinct stacks kept from a sampling report
+SAMPLING_REPORT_STACKS = 200
+
+class SamplingProfiler:
+    """
+    Samples one thread's call stack from a background thread. Cheap enough
+    to leave running on every document; the profile is only kept when the
+    run turns out to be slow.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self._target = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='document-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def report(self):
+        """Collapsed stacks ("root;...;leaf count"), most sampled first"""
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common(SAMPLING_REPORT_STACKS)]
+        return '\n'.join(lines)
+
+class ProfileRun:
+    """One profiled run; tasks attach stage timings for the slow check"""
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.stages = {}
+
+# Run being profiled in the current context, if any
+_current = contextvars.ContextVar('profile_run', default=None)
+
+def record_stages(stages):
+    """Attach stage timings to the run being profiled"""
+    run = _current.get()
+    if run is not None:
+        run.stages = dict(stages)
+
+def requested_by(request):
+    """
+    Whether the request asks for a profiled run via the X-Profile-Document
+    header: `1` from a staff user's session, or PROFILE_HEADER_SECRET from
+    anyone holding it
+    """
+    value = request.META.get('HTTP_X_PROFILE_DOCUMENT', '')
+    if not settings.PROFILE_HEADER_ENABLED or not value:
+        return False
+    secret = settings.PROFILE_HEADER_SECRET
+    if secret and hmac.compare_digest(value.encode('utf-8'), secret.encode('utf-8')):
+        return True
+    if value.lower() not in ('1', 'true', 'yes'):
+        return False
+    # DRF authenticates nobody here, so the user comes from the Django session
+    django_request = getattr(request, '_request', request)
+    return hasattr(django_request, 'session') and get_user(django_request).is_staff
+
+def get_trigger(force=False):
+    """Why this run should be profiled, or None"""
+    if force:
+        return 'header'
+    mode = settings.PROFILE_DOCUMENTS
+    if mode == 'always':
+        return 'setting'
+    if mode == 'slow':
+        return 'slow'
+    return None
+
+@contextmanager
+def profile_run(document_id, kind, force=False):
+    """
+    Profile one process/modify run of a document.
+
+    Runs requested by the setting or the request header are profiled with
+    cProfile. In 'slow' mode a sampling profiler runs instead and the
+    result is stored only if a stage (or the whole run, when no stage
+    timings are attached) exceeds PROFILE_SLOW_SECONDS.
+    """
+    trigger = get_trigger(force)
+    if trigger is None:
+        yield None
+        return
+    run = ProfileRun(trigger)
+    token = _current.set(run)
+
+    if trigger == 'slow':
+        profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL)
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        if trigger == 'slow':
+            profiler.stop()
+        else:
+            profiler.disable()
+        duration = time.perf_counter() - started
+        slowest = max(run.stages.values(), default=duration)
+        if trigger != 'slow' or slowest >= settings.PROFILE_SLOW_SECONDS:
+            try:
+                save_profile(document_id, kind, trigger, duration, profiler)
+            except Exception as e:
+                logger.error(f"Failed to store profile for document {document_id}: {e}")
+
+def profiled(kind):
+    """
+    Profile a process/modify entry point whose first argument is the
+    document ID. Callers pass `profile=True` to force a cProfile run.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(document_id, *args, profile=False, **kwargs):
+            with profile_run(document_id, kind, force=profile):
+                return func(document_id, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def save_profile(document_id, kind, trigger, duration, profiler):
+    from .models import DocumentProfile
+
+    if isinstance(profiler, SamplingProfiler):
+        profiler_name = 'sampling'
+        report = profiler.report()
+    else:
+        profiler_name = 'cprofile'
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(CPROFILE_REPORT_ROWS)
+        report = output.getvalue()
+
+    profile = DocumentProfile.objects.create(
+        document_id=document_id,
+        kind=kind,
+        trigger=trigger,
+        profiler=profiler_name,
+        duration=duration,
+        report=report,
+    )
+    logger.info(f"Stored {profiler_name} profile {profile.id} for document {document_id} ({duration:.2f}s)")
+    return profile
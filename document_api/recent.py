@@ -0,0 +1,54 @@
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from . import idempotency
+
+# Serializes read-modify-write of rings in the cache fallback, within one process
+_lock = threading.Lock()
+
+def client_id(request):
+    """
+    Stable ID of the client: the user, or a small random token kept in the
+    session, which is written once and never grows afterwards
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    session = request.session
+    if 'client' not in session:
+        session['client'] = uuid.uuid4().hex
+    # Sessions from before the ring carried every serialized upload
+    session.pop('documents', None)
+    return f"session:{session['client']}"
+
+def _key(client):
+    return f'recent-documents:{client}'
+
+def remember(request, document_id):
+    """Put a document at the front of the client's ring of recent IDs"""
+    key = _key(client_id(request))
+    document_id = str(document_id)
+    client = idempotency.redis_client()
+    if client is not None:
+        # One transaction, so concurrent uploads never drop each other's IDs
+        pipeline = client.pipeline(transaction=True)
+        pipeline.lrem(key, 0, document_id)
+        pipeline.lpush(key, document_id)
+        pipeline.ltrim(key, 0, settings.RECENT_DOCUMENTS_LIMIT - 1)
+        pipeline.expire(key, settings.RECENT_DOCUMENTS_TTL)
+        pipeline.execute()
+        return
+    cache = caches[settings.RECENT_DOCUMENTS_CACHE]
+    with _lock:
+        ids = [existing for existing in cache.get(key, []) if existing != document_id]
+        ids.insert(0, document_id)
+        cache.set(key, ids[:settings.RECENT_DOCUMENTS_LIMIT], settings.RECENT_DOCUMENTS_TTL)
+
+def recent_ids(request):
+    """The client's recent document IDs, newest first"""
+    key = _key(client_id(request))
+    client = idempotency.redis_client()
+    if client is not None:
+        return [document_id.decode() for document_id in client.lrange(key, 0, -1)]
+    return caches[settings.RECENT_DOCUMENTS_CACHE].get(key, [])
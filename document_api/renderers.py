@@ -0,0 +1,47 @@
+import re
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Types orjson would format on its own, differently from DRF's encoder
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+# Floats orjson writes differently from json.dumps: under 1e-4 it prints
+# 0.0000… or e-7 where json.dumps prints e-05 or e-07, and from 1e16 e16 for e+16.
+# A bare float, such as a list item rendered alone, ends the output.
+SMALL_FLOAT = b'0.0000'
+EXPONENT = re.compile(rb'e(?:-[1-9]|[0-9]+)(?:[,}\]]|$)')
+
+_encoder = encoders.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+def _orjson(data):
+    """orjson output, or None where it would differ from json.dumps"""
+    try:
+        rendered = orjson.dumps(data, option=ORJSON_OPTIONS)
+    except TypeError:
+        return None
+    if SMALL_FLOAT in rendered or EXPONENT.search(rendered):
+        return None
+    return rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+def _standard(data):
+    rendered = _encoder.encode(data)
+    return rendered.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+def render(data):
+    """
+    JSON bytes identical to DRF's JSONRenderer output, through orjson when
+    it is installed; items of a list it would format differently are redone
+    one by one. orjson writes NaN and infinity as null where DRF refuses them.
+    """
+    if orjson is None or not (api_settings.UNICODE_JSON and api_settings.COMPACT_JSON and api_settings.STRICT_JSON):
+        return JSONRenderer().render(data)
+    rendered = _orjson(data)
+    if rendered is not None:
+        return rendered
+    if isinstance(data, list):
+        return b'[' + b','.join(_orjson(item) or _standard(item) for item in data) + b']'
+    return _standard(data)
@@ -0,0 +1,128 @@
+import math
+import os
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from . import idempotency
+
+PROCESS_TASK = 'document_api.tasks.process_document'
+MODIFY_TASK = 'document_api.tasks.modify_document'
+
+# Redis delivers lower priority numbers first; 0-9 are configured as steps
+HIGHEST_PRIORITY = 0
+LOWEST_PRIORITY = 9
+
+Route = namedtuple('Route', ['queue', 'priority', 'cost'])
+
+def needs_llm(task_name):
+    """Whether the task will call out to an LLM (mirrors process_text_with_nlp)"""
+    from .nlp_services import openai
+    return task_name == MODIFY_TASK and openai is not None and bool(os.getenv('OPENAI_API_KEY'))
+
+def estimate_pages(file_size, known_pages=0):
+    """Pages counted by an earlier extraction, else a guess from the file size"""
+    if known_pages:
+        return known_pages
+    return max(1, file_size // settings.DOCUMENT_BYTES_PER_PAGE)
+
+def estimate_cost(file_size, pages, llm=False):
+    """Relative cost of a task in rough worker-seconds"""
+    cost = file_size / (1024 * 1024) * settings.DOCUMENT_COST_PER_MB + pages * settings.DOCUMENT_COST_PER_PAGE
+    if llm:
+        cost += settings.DOCUMENT_COST_LLM
+    return cost
+
+def plan_route(cost, llm=False, tenant_cost=0):
+    """
+    Pick the queue and priority for a task of the given cost.
+
+    Cheap tasks go to the interactive queue and expensive ones to bulk;
+    LLM calls get their own queue. Within a queue, costlier tasks and
+    tenants that have recently submitted more than their fair share
+    are delivered later.
+    """
+    if llm:
+        queue = 'llm'
+    elif cost <= settings.DOCUMENT_QUEUES['interactive']['max_cost']:
+        queue = 'interactive'
+    else:
+        queue = 'bulk'
+    size_rank = min(4, int(math.log2(1 + cost)))
+    tenant_rank = min(5, int(tenant_cost // settings.TENANT_FAIR_SHARE_COST))
+    priority = min(LOWEST_PRIORITY, HIGHEST_PRIORITY + size_rank + tenant_rank)
+    return Route(queue, priority, cost)
+
+def _usage_key(tenant):
+    return f'tenant-cost:{tenant}'
+
+def get_tenant_cost(tenant):
+    """Cost the tenant submitted within the current fairness window"""
+    if not tenant:
+        return 0
+    client = idempotency.redis_client()
+    if client is not None:
+        return int(client.get(_usage_key(tenant)) or 0)
+    return cache.get(_usage_key(tenant), 0)
+
+def charge_tenant(tenant, cost):
+    """Add a task's cost to the tenant's window; the window expires as a whole"""
+    if not tenant:
+        return
+    key = _usage_key(tenant)
+    amount = max(1, int(cost))
+    client = idempotency.redis_client()
+    if client is not None:
+        # Every web process charges the same counter; NX starts the window
+        # with the first charge instead of extending it on each one
+        pipeline = client.pipeline(transaction=True)
+        pipeline.incrby(key, amount)
+        pipeline.expire(key, settings.TENANT_FAIR_SHARE_WINDOW, nx=True)
+        pipeline.execute()
+        return
+    if not cache.add(key, amount, settings.TENANT_FAIR_SHARE_WINDOW):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, settings.TENANT_FAIR_SHARE_WINDOW)
+
+def route_document(task_name, document, tenant=''):
+    pages = (document.processing_metrics or {}).get('process', {}).get('pages', 0)
+    llm = needs_llm(task_name)
+    cost = estimate_cost(document.file_size, estimate_pages(document.file_size, pages), llm)
+    return plan_route(cost, llm, get_tenant_cost(tenant))
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """CELERY_TASK_ROUTES entry for document tasks sent without an explicit queue"""
+    if name not in (PROCESS_TASK, MODIFY_TASK) or not args:
+        return None
+    from .models import Document
+    try:
+        document = Document.objects.get(id=args[0])
+    except (Document.DoesNotExist, ValueError):
+        return None
+    route = route_document(name, document)
+    return {'queue': route.queue, 'priority': route.priority}
+
+def get_tenant(request):
+    """The user, session or client address a request is accounted to"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f'session:{session.session_key}'
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
+
+def dispatch(task, document, *args, tenant='', **kwargs):
+    """Queue a document task on its routed queue, charging the tenant's share"""
+    route = route_document(task.name, document, tenant)
+    charge_tenant(tenant, route.cost)
+    return task.apply_async((str(document.id),) + args, kwargs, queue=route.queue, priority=route.priority)
+
+def worker_command(queue):
+    """Celery worker command line tuned for one queue"""
+    options = settings.DOCUMENT_QUEUES[queue]
+    return (
+        f"celery -A document_api worker -Q {queue} -n {queue}@%h "
+        f"--concurrency {options['concurrency']} --prefetch-multiplier {options['prefetch_multiplier']} -O fair"
+    )
@@ -0,0 +1,222 @@
+import hashlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Large word dictionaries referenced by a rule pack are stored in this
+# compact format and memory-mapped read-only, so every worker process
+# shares the same pages instead of holding its own copy
+DICTIONARY_MAGIC = b'RPD1'
+# magic, entry count
+_HEADER = struct.Struct('<4sI')
+# key offset, key length, value offset, value length
+_ENTRY = struct.Struct('<IHIH')
+
+# Shared across registries so caches keyed on a generation never collide
+_generations = itertools.count(1)
+
+class MappedDictionary:
+    """Read-only word -> replacement table memory-mapped from a .rpd file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != DICTIONARY_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a rule dictionary")
+
+    def __len__(self):
+        return self._count
+
+    def get(self, word, default=None):
+        """Binary search the sorted key index for an exact match"""
+        key = word.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, value_offset, value_length = _ENTRY.unpack_from(
+                self._map, _HEADER.size + middle * _ENTRY.size
+            )
+            probe = self._map[key_offset:key_offset + key_length]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                return self._map[value_offset:value_offset + value_length].decode('utf-8')
+        return default
+
+    def close(self):
+        self._map.close()
+
+def build_dictionary(entries, path):
+    """
+    Write (word, replacement) pairs to a memory-mappable .rpd file.
+    The file is replaced atomically so workers mapping the old version
+    keep reading it until they reload.
+    """
+    table = {}
+    for word, replacement in entries:
+        table[word.encode('utf-8')] = replacement.encode('utf-8')
+    items = sorted(table.items())
+
+    offset = _HEADER.size + len(items) * _ENTRY.size
+    index = bytearray()
+    blob = bytearray()
+    for key, value in items:
+        index += _ENTRY.pack(offset + len(blob), len(key), offset + len(blob) + len(key), len(value))
+        blob += key
+        blob += value
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(_HEADER.pack(DICTIONARY_MAGIC, len(items)))
+        file.write(index)
+        file.write(blob)
+    os.replace(temp_path, path)
+    return len(items)
+
+class RulePack:
+    """One versioned JSON rule pack from settings.RULE_PACK_DIRS"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            raw = file.read()
+        data = json.loads(raw)
+
+        self.path = path
+        self.name = data['name']
+        self.version = data.get('version', 1)
+        self.priority = data.get('priority', 100)
+        self.triggers = tuple(data.get('triggers', [self.name]))
+        self.nlp_passes = tuple(data.get('nlp_passes', []))
+        self.message = data.get('message', "Applied {pattern} rule")
+        self.case_insensitive_check = data.get('case_insensitive_check', False)
+        self.rules = tuple(data.get('rules', {}).items())
+        if any(not pattern for pattern, _ in self.rules):
+            # An empty pattern matches everywhere and would never advance
+            raise ValueError(f"Rule pack {self.name} has an empty pattern")
+
+        digest = hashlib.sha256(raw)
+        self.dictionary = None
+        if data.get('dictionary'):
+            dictionary_path = os.path.join(os.path.dirname(path), data['dictionary'])
+            self.dictionary = MappedDictionary(dictionary_path)
+            stat = os.stat(dictionary_path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        self.digest = digest.hexdigest()[:16]
+
+    def close(self):
+        if self.dictionary:
+            self.dictionary.close()
+
+class RulePackRegistry:
+    """Loads every pack in a set of directories and reloads them on change"""
+
+    def __init__(self, directories, reload_interval):
+        self.directories = tuple(str(directory) for directory in directories)
+        self.reload_interval = reload_interval
+        self.generation = 0
+        self._packs = ()
+        # (time replaced, packs) still mapped for matchers built before a reload
+        self._retired = []
+        self._signature = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Stat every pack and dictionary file; any change triggers a reload"""
+        signature = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+                if entry.name.endswith(('.json', '.rpd')):
+                    stat = entry.stat()
+                    signature.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def _load(self, signature):
+        packs = []
+        for path, _, _ in signature:
+            if not path.endswith('.json'):
+                continue
+            try:
+                packs.append(RulePack(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Skipping rule pack {path}: {e}")
+        packs.sort(key=lambda pack: (pack.priority, pack.name))
+        return tuple(packs)
+
+    def packs(self):
+        """Current packs ordered by priority"""
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.reload_interval:
+            return self._packs
+
+        with self._lock:
+            self._checked_at = now
+            signature = self._scan()
+            if signature != self._signature:
+                # Old packs stay mapped for RULE_PACK_CLOSE_DELAY seconds; matchers
+                # built from them may still be in use
+                self._retired.append((now, self._packs))
+                self._packs = self._load(signature)
+                self._signature = signature
+                self.generation = next(_generations)
+                logger.info(f"Loaded {len(self._packs)} rule packs (generation {self.generation})")
+            self._close_retired(now - settings.RULE_PACK_CLOSE_DELAY)
+        return self._packs
+
+    def _close_retired(self, before):
+        """Unmap the dictionaries of packs replaced at or before `before`"""
+        retired = []
+        for replaced_at, packs in self._retired:
+            if replaced_at <= before:
+                for pack in packs:
+                    pack.close()
+            else:
+                retired.append((replaced_at, packs))
+        self._retired = retired
+
+    def close(self):
+        """Unmap every pack this registry has loaded"""
+        with self._lock:
+            self._close_retired(float('inf'))
+            for pack in self._packs:
+                pack.close()
+            self._packs = ()
+            self._signature = None
+
+    def get(self, name):
+        for pack in self.packs():
+            if pack.name == name:
+                return pack
+        return None
+
+_registry = None
+
+def get_registry():
+    """Process-wide registry built from settings.RULE_PACK_DIRS"""
+    global _registry
+    directories = tuple(str(directory) for directory in settings.RULE_PACK_DIRS)
+    if _registry is None or _registry.directories != directories:
+        _registry = RulePackRegistry(directories, settings.RULE_PACK_RELOAD_INTERVAL)
+    _registry.reload_interval = settings.RULE_PACK_RELOAD_INTERVAL
+    return _registry
+
+def get_rule_packs():
+    return get_registry().packs()
+
+def get_rule_pack(name):
+    return get_registry().get(name)
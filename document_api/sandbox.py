@@ -0,0 +1,264 @@
+import os
+import pickle
+import resource
+import select
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Length prefix of every message exchanged with a child
+_HEADER = struct.Struct('>I')
+# How often the parent checks a busy child's RSS and the wall clock
+POLL_INTERVAL = 0.1
+
+class SandboxError(Exception):
+    pass
+
+class LimitExceeded(SandboxError):
+    """The child hit a resource limit while extracting"""
+
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+class _CPUTimeExceeded(BaseException):
+    # BaseException so the extractors' `except Exception` blocks don't swallow it
+    pass
+
+def _write_message(stream, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+def _read_message(stream):
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    size = _HEADER.unpack(header)[0]
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return pickle.loads(data)
+
+def _read_rss(pid):
+    """Resident set size of a process in bytes, or 0 if it is gone"""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return 0
+
+class SandboxWorker:
+    """
+    A warm child process that extracts text on request. The parent watches
+    its RSS and the wall clock; the child enforces its own CPU time limit
+    and an address-space cap as a backstop.
+    """
+
+    def __init__(self):
+        limits = settings.EXTRACTION_LIMITS
+        # Address space is a much looser measure than RSS, so give it headroom
+        address_space = limits['max_rss_mb'] * settings.EXTRACTION_ADDRESS_SPACE_FACTOR * 1024 * 1024
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'document_api.settings')}
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'document_api.sandbox', str(int(address_space))],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=str(settings.BASE_DIR),
+            env=env,
+        )
+        self.tasks = 0
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+    def run(self, request, timeout, max_rss):
+        """Send one request and wait for its response under the parent-side limits"""
+        self.tasks += 1
+        try:
+            _write_message(self.process.stdin, request)
+        except (BrokenPipeError, OSError) as e:
+            self.kill()
+            raise SandboxError(f"Extraction child is gone: {e}")
+
+        deadline = time.monotonic() + timeout
+        output = self.process.stdout
+        while True:
+            ready, _, _ = select.select([output], [], [], POLL_INTERVAL)
+            if ready:
+                response = _read_message(output)
+                if response is None:
+                    code = self.process.wait()
+                    self.kill()
+                    raise SandboxError(f"Extraction child exited with status {code}")
+                return response
+            rss = _read_rss(self.process.pid)
+            if rss > max_rss:
+                self.kill()
+                raise LimitExceeded('memory', f"RSS of {rss // (1024 * 1024)} MB exceeds the limit")
+            if time.monotonic() > deadline:
+                self.kill()
+                raise LimitExceeded('time', f"No result after {timeout} seconds")
+
+# Idle warm children of this process
+_idle = []
+_lock = threading.Lock()
+
+def _acquire():
+    with _lock:
+        while _idle:
+            worker = _idle.pop()
+            if worker.alive:
+                return worker
+            worker.kill()
+    return SandboxWorker()
+
+def _release(worker):
+    if not worker.alive:
+        return
+    with _lock:
+        if worker.tasks < settings.EXTRACTION_SANDBOX_MAX_TASKS and len(_idle) < settings.EXTRACTION_SANDBOX_POOL_SIZE:
+            _idle.append(worker)
+            return
+    worker.close()
+
+def shutdown():
+    """Stop all idle children"""
+    with _lock:
+        workers = list(_idle)
+        _idle.clear()
+    for worker in workers:
+        worker.close()
+
+def _run_isolated(file_path, content_type, max_pages, limits):
+    request = {
+        'path': file_path,
+        'content_type': content_type,
+        'max_pages': max_pages,
+        'max_objects': limits['max_objects'],
+        'cpu_seconds': limits['cpu_seconds'],
+    }
+    worker = _acquire()
+    try:
+        response = worker.run(
+            request,
+            timeout=limits['cpu_seconds'] * 2 + 5,
+            max_rss=limits['max_rss_mb'] * 1024 * 1024,
+        )
+    finally:
+        _release(worker)
+    if response['ok']:
+        return response['result']
+    if response['limit'] == 'error':
+        raise SandboxError(response['error'])
+    raise LimitExceeded(response['limit'], response['error'])
+
+def extract(file_path, content_type):
+    """
+    Extract a document's text under EXTRACTION_LIMITS.
+
+    With EXTRACTION_SANDBOX on, extraction runs in a warm child process.
+    If the child hits a memory or CPU limit, the document is retried with
+    only its first EXTRACTION_FALLBACK_PAGES pages, and failing that comes
+    back empty; either way the result is marked partial instead of the
+    worker being killed.
+    """
+    from .tasks import ExtractionResult, extract_document_text
+
+    limits = settings.EXTRACTION_LIMITS
+    if not settings.EXTRACTION_SANDBOX:
+        return extract_document_text(file_path, content_type, limits['max_pages'], limits['max_objects'])
+
+    try:
+        return _run_isolated(file_path, content_type, limits['max_pages'], limits)
+    except SandboxError as e:
+        logger.warning(f"Extraction of {file_path} failed in the sandbox: {e}")
+        reason = str(e)
+
+    fallback_pages = min(limits['max_pages'], settings.EXTRACTION_FALLBACK_PAGES)
+    if content_type == 'application/pdf' and fallback_pages:
+        try:
+            result = _run_isolated(file_path, content_type, fallback_pages, limits)
+            return result._replace(partial=True, reason=f"{reason}; only the first {result.pages} pages were processed")
+        except SandboxError as e:
+            logger.warning(f"Fallback extraction of {file_path} failed in the sandbox: {e}")
+    return ExtractionResult('', 0, True, reason)
+
+def _on_cpu_limit(signum, frame):
+    raise _CPUTimeExceeded()
+
+def _set_cpu_limit(seconds):
+    """Raise SIGXCPU once this process has used `seconds` more CPU time"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = resource.RLIM_INFINITY if seconds is None else int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    if hard != resource.RLIM_INFINITY and (soft == resource.RLIM_INFINITY or soft > hard):
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def serve(address_space):
+    """Child side: answer extraction requests from stdin until it closes"""
+    import django
+    django.setup()
+    from .tasks import extract_document_text
+
+    # Responses go to a private copy of stdout; anything a library prints lands on stderr
+    output = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    requests = sys.stdin.buffer
+
+    if address_space:
+        resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    while True:
+        request = _read_message(requests)
+        if request is None:
+            break
+        exit_after = False
+        try:
+            _set_cpu_limit(request['cpu_seconds'])
+            result = extract_document_text(
+                request['path'], request['content_type'], request['max_pages'], request['max_objects']
+            )
+            response = {'ok': True, 'result': result}
+        except _CPUTimeExceeded:
+            response = {'ok': False, 'limit': 'cpu', 'error': f"CPU time exceeds {request['cpu_seconds']} seconds"}
+        except MemoryError:
+            # The heap may be fragmented past use; let the parent start a fresh child
+            response = {'ok': False, 'limit': 'memory', 'error': "Address space limit reached"}
+            exit_after = True
+        except Exception as e:
+            response = {'ok': False, 'limit': 'error', 'error': str(e)}
+        finally:
+            _set_cpu_limit(None)
+        _write_message(output, response)
+        if exit_after:
+            break
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -1,5 +1,10 @@
-from rest_framework import serializers
-from .models import Document
+from datetime import datetime
+from functools import lru_cache
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
+from .models import Document, UploadSession
+from .uploads import StoredUpload, is_word_document
 try:
     import magic
 except ImportError:
@@ -14,9 +19,13 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
     
     def validate_file(self, value):
         # File size validation (10MB limit)
-        if value.size > 10 * 1024 * 1024:
+        if value.size > settings.DOCUMENT_UPLOAD_MAX_SIZE:
             raise serializers.ValidationError("File size cannot exceed 10MB")
         
+        # Streamed uploads were sniffed and size-checked while being written
+        if isinstance(value, StoredUpload):
+            return value
+        
         # MIME type validation
         allowed_types = [
             'application/pdf',
@@ -43,10 +52,23 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
             if value.content_type not in allowed_types:
                 raise serializers.ValidationError("Invalid file type. Only PDF and Word documents are allowed.")
         
+        # A Word signature or type only names the container; look inside it
+        if value.content_type != 'application/pdf' and not is_word_document(value):
+            raise serializers.ValidationError("Invalid file type. Only PDF and Word documents are allowed.")
+        
         return value
     
     def create(self, validated_data):
         file = validated_data['file']
+        if isinstance(file, StoredUpload):
+            # Already in place; only the name is stored
+            return Document.objects.create(
+                file=file.storage_name,
+                original_filename=file.name,
+                file_size=file.size,
+                content_type=file.content_type,
+                content_hash=file.content_hash
+            )
         document = Document.objects.create(
             file=file,
             original_filename=file.name,
@@ -58,7 +80,91 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ['id', 'original_filename', 'file_size', 'content_type', 'status', 'uploaded_at', 'processed_at', 'modified_file', 'modification_guidelines', 'modified_at']
+        fields = ['id', 'original_filename', 'file_size', 'content_type', 'status', 'uploaded_at', 'processed_at', 'modified_file', 'modification_guidelines', 'modified_at', 'processing_metrics', 'is_partial', 'partial_reason']
+
+class DocumentRowSerializer:
+    """
+    Read-only DocumentSerializer for `.values()` rows: the same fields and
+    representations, with one conversion function chosen per field up front
+    instead of field instances and FieldFile objects per document
+    """
+
+    fields = DocumentSerializer.Meta.fields
+
+    def __init__(self):
+        self.converters = _row_converters()
+
+    def values(self, queryset):
+        return queryset.values(*self.fields)
+
+    def to_representation(self, row):
+        return {
+            name: None if row[name] is None else convert(row[name]) if convert else row[name]
+            for name, convert in self.converters
+        }
+
+    def serialize(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+@lru_cache(maxsize=None)
+def _row_converters():
+    return tuple((name, _row_converter(field)) for name, field in DocumentSerializer().fields.items())
+
+def _row_converter(field):
+    """Function giving `field`'s representation of a non-null column value, or None for the value itself"""
+    if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+        return str
+    if isinstance(field, serializers.FileField):
+        storage = Document._meta.get_field(field.source).storage
+        return lambda name: storage.url(name) if name else None
+    if isinstance(field, serializers.DateTimeField) and not settings.USE_TZ and (
+        getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+    ):
+        # Naive values; DRF only rewrites a +00:00 offset
+        return datetime.isoformat
+    if isinstance(field, (serializers.CharField, serializers.ChoiceField, serializers.BooleanField,
+                          serializers.IntegerField, serializers.JSONField)):
+        # Columns already hold these types
+        return None
+    return field.to_representation
 
 class DocumentModificationSerializer(serializers.Serializer):
-    guidelines = serializers.CharField(max_length=2000, help_text="Guidelines for document modification")
\ No newline at end of file
+    guidelines = serializers.CharField(max_length=2000, help_text="Guidelines for document modification")
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['original_filename', 'content_type', 'size', 'checksum']
+    
+    def validate_original_filename(self, value):
+        if value.rsplit('.', 1)[-1].lower() not in ('pdf', 'doc', 'docx'):
+            raise serializers.ValidationError("Only PDF and Word documents are allowed.")
+        return value
+    
+    def validate_content_type(self, value):
+        allowed_types = [
+            'application/pdf',
+            'application/msword',
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        ]
+        if value not in allowed_types:
+            raise serializers.ValidationError("Invalid file type. Only PDF and Word documents are allowed.")
+        return value
+    
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File is empty")
+        if value > settings.UPLOAD_SESSION_MAX_SIZE:
+            raise serializers.ValidationError(f"File size cannot exceed {settings.UPLOAD_SESSION_MAX_SIZE // (1024 * 1024)}MB")
+        return value
+    
+    def validate_checksum(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+            raise serializers.ValidationError("Checksum must be a hex SHA-256 digest")
+        return value
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_filename', 'content_type', 'size', 'checksum', 'received', 'status', 'document', 'created_at', 'updated_at']
@@ -0,0 +1,161 @@
+import hashlib
+import re
+import struct
+from django.conf import settings
+from django.db import transaction
+from . import page_store
+from .changeset import Change, iter_applied
+from .models import Document, DocumentChange, DocumentSignature, SignatureBucket
+from .paragraph_memo import PARAGRAPH_SEPARATOR, paragraph_key
+
+WORD_PATTERN = re.compile(r"\w+")
+# A shingle hash modulo the bin count picks its bin and the low bits of the
+# quotient are its value. An empty bin borrows the next full bin's value plus
+# this step per bin skipped (at most MAX_BORROW), so borrowed values never
+# collide with real ones and every value fits in 64 bits.
+VALUE_BITS = 56
+BORROW_STEP = 2 ** VALUE_BITS
+MAX_BORROW = 2 ** (64 - VALUE_BITS) - 1
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+def shingles(text, size=None):
+    """Distinct runs of `size` consecutive lowercased words; none for shorter text"""
+    size = size or settings.SIMILARITY_SHINGLE_WORDS
+    words = WORD_PATTERN.findall(text.lower())
+    return {' '.join(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+def signature_size():
+    return settings.SIMILARITY_BANDS * settings.SIMILARITY_ROWS
+
+def compute_signature(text):
+    """
+    MinHash signature of the text's shingles by one-permutation hashing:
+    each shingle is hashed once into one of the bins, which keep their
+    minimum. Empty bins are filled from the next full bin. None for text
+    shorter than one shingle.
+    """
+    bins = signature_size()
+    signature = [None] * bins
+    for shingle in shingles(text):
+        quotient, bin_index = divmod(_hash64(shingle.encode('utf-8')), bins)
+        value = quotient % BORROW_STEP
+        if signature[bin_index] is None or value < signature[bin_index]:
+            signature[bin_index] = value
+    if all(value is None for value in signature):
+        return None
+    dense = []
+    for index in range(bins):
+        distance = 0
+        while signature[(index + distance) % bins] is None:
+            distance += 1
+        dense.append(signature[(index + distance) % bins] + min(distance, MAX_BORROW) * BORROW_STEP)
+    return dense
+
+def pack(signature):
+    return struct.pack(f'<{len(signature)}Q', *signature)
+
+def unpack(data):
+    return struct.unpack(f'<{len(data) // 8}Q', data)
+
+def band_keys(signature):
+    """One bucket key per band; documents sharing any key are candidates"""
+    rows = settings.SIMILARITY_ROWS
+    return [
+        int.from_bytes(
+            hashlib.blake2b(bytes([band]) + pack(signature[band * rows:(band + 1) * rows]), digest_size=8).digest(),
+            'little', signed=True,
+        )
+        for band in range(settings.SIMILARITY_BANDS)
+    ]
+
+def estimate_similarity(first, second):
+    """Estimated Jaccard similarity: the share of signature positions that agree"""
+    if len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+def index(document_id, text):
+    """Store the document's signature and its band buckets, replacing any earlier ones"""
+    signature = compute_signature(text)
+    with transaction.atomic():
+        SignatureBucket.objects.filter(document_id=document_id).delete()
+        DocumentSignature.objects.filter(document_id=document_id).delete()
+        if signature is None:
+            return None
+        DocumentSignature.objects.create(document_id=document_id, signature=pack(signature))
+        SignatureBucket.objects.bulk_create(
+            SignatureBucket(key=key, document_id=document_id) for key in set(band_keys(signature))
+        )
+    return signature
+
+def similar(document_id, min_similarity=None, limit=None):
+    """
+    (document id, estimated similarity) of the documents most like this one,
+    best first, or None if it has no signature. Only documents sharing a
+    band bucket are scored, so the cost follows the bucket sizes rather than
+    the corpus.
+    """
+    min_similarity = settings.SIMILAR_DOCUMENTS_MIN if min_similarity is None else min_similarity
+    try:
+        own = unpack(DocumentSignature.objects.get(document_id=document_id).signature)
+    except DocumentSignature.DoesNotExist:
+        return None
+    candidates = SignatureBucket.objects.filter(key__in=band_keys(own)).exclude(
+        document_id=document_id
+    ).values_list('document_id', flat=True).distinct()[:settings.SIMILARITY_MAX_CANDIDATES]
+    scored = []
+    for candidate_id, data in DocumentSignature.objects.filter(document_id__in=candidates).values_list('document_id', 'signature'):
+        score = estimate_similarity(own, unpack(data))
+        if score >= min_similarity:
+            scored.append((candidate_id, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:limit] if limit else scored
+
+def closest_match(document_id, fingerprint):
+    """The most similar document whose stored changes were made under `fingerprint`"""
+    matches = similar(document_id, min_similarity=settings.SIMILARITY_REUSE_THRESHOLD) or []
+    eligible = set(Document.objects.filter(
+        id__in=[match_id for match_id, _ in matches], changes_fingerprint=fingerprint
+    ).values_list('id', flat=True))
+    return next((match_id for match_id, _ in matches if match_id in eligible), None)
+
+def reusable_results(document_id, matcher):
+    """
+    Paragraph memo entries rebuilt from the closest near-duplicate's stored
+    change set and page text, for a rewrite of this document under `matcher`.
+    Empty when there is no such match or its changes no longer line up with
+    its text.
+    """
+    match_id = closest_match(document_id, matcher.fingerprint)
+    if match_id is None:
+        return {}
+    text = page_store.read_text(match_id)
+    if text is None:
+        return {}
+    rules = {message: position for position, message in enumerate(matcher.messages)}
+    changes = DocumentChange.objects.filter(document_id=match_id).values_list(
+        'offset', 'length', 'original', 'replacement', 'rule'
+    ).iterator()
+    change = next(changes, None)
+    results = {}
+    start = 0
+    for paragraph in text.split(PARAGRAPH_SEPARATOR):
+        end = start + len(paragraph)
+        spans = []
+        while change is not None and change[0] <= end:
+            offset, length, original, replacement, rule = change
+            if text[offset:offset + length] != original or rule not in rules:
+                return {}
+            spans.append(Change(offset - start, length, replacement, rules[rule]))
+            change = next(changes, None)
+        modified = ''.join(iter_applied(paragraph, spans))
+        applied = tuple(sorted({span.rule for span in spans}))
+        results[paragraph_key(paragraph, matcher.fingerprint)] = (modified, applied, tuple(spans))
+        start = end + len(PARAGRAPH_SEPARATOR)
+    return results
+
+def reuse_for(document_id):
+    """The `reuse` hook of tasks.rewrite_text for one document"""
+    return lambda matcher: reusable_results(document_id, matcher)
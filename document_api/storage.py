@@ -0,0 +1,363 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+COMPRESSED_SUFFIX = '.gz'
+COPY_BLOCK = 1024 * 1024
+
+def cold_storage():
+    """The slower tier configured as STORAGES['cold'], if any"""
+    if 'cold' not in settings.STORAGES:
+        return None
+    return storages['cold']
+
+def _is_missing(error):
+    if isinstance(error, FileNotFoundError):
+        return True
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+@deconstructible
+class DocumentStorage(FileSystemStorage):
+    """
+    Local storage that reads cold originals back from their gzip copies
+    and falls through to the cold tier for files moved there, so callers
+    keep opening documents by their original name.
+    """
+
+    def _compressed_path(self, name):
+        return self.path(name) + COMPRESSED_SUFFIX
+
+    def is_compressed(self, name):
+        return not os.path.exists(self.path(name)) and os.path.exists(self._compressed_path(name))
+
+    def _open(self, name, mode='rb'):
+        if os.path.exists(self.path(name)):
+            return super()._open(name, mode)
+        if self.is_compressed(name):
+            file = File(gzip.open(self._compressed_path(name), 'rb'), name=name)
+            file.size = self.size(name)
+            return file
+        cold = cold_storage()
+        if cold is not None and cold.exists(name):
+            return cold.open(name, mode)
+        return super()._open(name, mode)
+
+    def exists(self, name):
+        if super().exists(name) or os.path.exists(self._compressed_path(name)):
+            return True
+        cold = cold_storage()
+        return cold is not None and cold.exists(name)
+
+    def size(self, name):
+        if os.path.exists(self.path(name)):
+            return super().size(name)
+        if self.is_compressed(name):
+            # The gzip trailer holds the uncompressed size modulo 2**32
+            with open(self._compressed_path(name), 'rb') as file:
+                file.seek(-4, os.SEEK_END)
+                return int.from_bytes(file.read(4), 'little')
+        cold = cold_storage()
+        if cold is not None and cold.exists(name):
+            return cold.size(name)
+        return super().size(name)
+
+    def delete(self, name):
+        super().delete(name)
+        super().delete(name + COMPRESSED_SUFFIX)
+        cold = cold_storage()
+        if cold is not None:
+            cold.delete(name)
+
+    def compress(self, name, max_ratio=None):
+        """
+        Replace a file with its gzip copy unless that saves too little
+        (already-compressed PDFs mostly). Returns whether it was replaced.
+        """
+        max_ratio = settings.STORAGE_COMPRESSION_MAX_RATIO if max_ratio is None else max_ratio
+        path = self.path(name)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=COMPRESSED_SUFFIX)
+        try:
+            with open(path, 'rb') as source, os.fdopen(descriptor, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as destination:
+                shutil.copyfileobj(source, destination, COPY_BLOCK)
+            if os.path.getsize(temporary_path) > os.path.getsize(path) * max_ratio:
+                os.unlink(temporary_path)
+                return False
+            os.replace(temporary_path, self._compressed_path(name))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        os.unlink(path)
+        return True
+
+    def replace(self, name, content):
+        """
+        Write a file under exactly this name, replacing any earlier one in a
+        single rename, so readers see either the old file or the new one
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(descriptor, 'wb') as destination:
+                for chunk in content.chunks():
+                    destination.write(chunk)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        return name
+
+    def decompress(self, name):
+        """Restore a compressed file in place"""
+        path = self.path(name)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with gzip.open(self._compressed_path(name), 'rb') as source, os.fdopen(descriptor, 'wb') as destination:
+                shutil.copyfileobj(source, destination, COPY_BLOCK)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        os.unlink(self._compressed_path(name))
+
+    def move_to_cold(self, name):
+        """
+        Copy a hot file to the cold tier, then drop the hot copy. The cold
+        copy is only replaced while the hot one exists, so rerunning an
+        interrupted move never deletes the last copy.
+        """
+        cold = cold_storage()
+        if cold is None:
+            raise ImproperlyConfigured("STORAGES has no 'cold' tier")
+        if not os.path.exists(self.path(name)):
+            # An earlier move dropped the hot copy before its tier was recorded
+            if cold.exists(name):
+                return
+            raise FileNotFoundError(name)
+        size = super().size(name)
+        if not cold.exists(name):
+            with super()._open(name, 'rb') as file:
+                stored = cold.save(name, file)
+            if stored != name:
+                cold.delete(stored)
+                raise OSError(f"Cold tier stored {name} as {stored}")
+        elif cold.size(name) != size:
+            # A partial copy left by an interrupted move is overwritten in place
+            with super()._open(name, 'rb') as file:
+                cold._save(name, file)
+        if cold.size(name) != size:
+            raise OSError(f"Cold copy of {name} is {cold.size(name)} bytes, expected {size}")
+        super().delete(name)
+
+    def local_path(self, name):
+        """
+        A local path with the file's content for readers that need one:
+        compressed files are restored and cold files brought back first
+        """
+        if self.is_compressed(name):
+            self.decompress(name)
+        elif not os.path.exists(self.path(name)):
+            cold = cold_storage()
+            if cold is not None and cold.exists(name):
+                with cold.open(name, 'rb') as file:
+                    super()._save(name, file)
+                cold.delete(name)
+        return self.path(name)
+
+def local_path(field_file):
+    """Local path of a stored file, downloading it first from remote storages"""
+    storage = field_file.storage
+    if hasattr(storage, 'local_path'):
+        return storage.local_path(field_file.name)
+    try:
+        return storage.path(field_file.name)
+    except NotImplementedError:
+        pass
+    path = os.path.join(settings.STORAGE_LOCAL_CACHE, field_file.name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as destination, storage.open(field_file.name, 'rb') as source:
+            shutil.copyfileobj(source, destination, COPY_BLOCK)
+        os.replace(temporary_path, path)
+    return path
+
+class LocalS3Client:
+    """
+    Stand-in for the subset of the boto3 S3 client S3Storage uses, keeping
+    objects under `root/<bucket>/<key>`. For tests and development.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        parts = key.split('/')
+        if not key or '..' in parts or key.startswith('/'):
+            raise ValueError(f"Invalid key: {key}")
+        return os.path.join(self.root, bucket, *parts)
+
+    def head_object(self, Bucket, Key):
+        stat = os.stat(self._path(Bucket, Key))
+        return {
+            'ContentLength': stat.st_size,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        }
+
+    def get_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        return {'Body': open(path, 'rb'), 'ContentLength': os.path.getsize(path)}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as destination:
+            shutil.copyfileobj(Fileobj, destination, COPY_BLOCK)
+        os.replace(temporary_path, path)
+
+    def delete_object(self, Bucket, Key):
+        try:
+            os.unlink(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter='', ContinuationToken=None):
+        base = os.path.join(self.root, Bucket)
+        keys = []
+        for directory, _, files in os.walk(base):
+            for filename in files:
+                key = os.path.relpath(os.path.join(directory, filename), base).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        contents = []
+        prefixes = set()
+        for key in sorted(keys):
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefixes.add(Prefix + rest.split(Delimiter)[0] + Delimiter)
+            else:
+                contents.append({'Key': key, 'Size': os.path.getsize(os.path.join(base, *key.split('/')))})
+        return {
+            'Contents': contents,
+            'CommonPrefixes': [{'Prefix': prefix} for prefix in sorted(prefixes)],
+            'IsTruncated': False,
+        }
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return 'file://' + quote(self._path(Params['Bucket'], Params['Key']))
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Storage on any S3-compatible object store through boto3, or through
+    LocalS3Client when `local_root` is given.
+    """
+
+    def __init__(self, bucket='', prefix='', endpoint_url=None, region_name=None, local_root=None, url_expiry=3600):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.local_root = local_root
+        self.url_expiry = url_expiry
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.local_root:
+                self._client = LocalS3Client(self.local_root)
+            elif boto3 is None:
+                raise ImproperlyConfigured("S3Storage needs boto3 installed, or local_root for the local stand-in")
+            else:
+                self._client = boto3.client('s3', endpoint_url=self.endpoint_url, region_name=self.region_name)
+        return self._client
+
+    def _key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError("S3Storage files are read-only once stored")
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if _is_missing(e):
+                raise FileNotFoundError(name) from e
+            raise
+        file = File(response['Body'], name=name)
+        file.size = response['ContentLength']
+        return file
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(content, self.bucket, self._key(name))
+        return name
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def get_modified_time(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['LastModified']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(name)}, ExpiresIn=self.url_expiry
+        )
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip('/')
+        prefix = f'{prefix}/' if prefix else ''
+        directories, files = [], []
+        token = None
+        while True:
+            arguments = {'Bucket': self.bucket, 'Prefix': prefix, 'Delimiter': '/'}
+            if token:
+                arguments['ContinuationToken'] = token
+            response = self.client.list_objects_v2(**arguments)
+            directories.extend(entry['Prefix'][len(prefix):].rstrip('/') for entry in response.get('CommonPrefixes', []))
+            files.extend(entry['Key'][len(prefix):] for entry in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return directories, files
+            token = response['NextContinuationToken']
@@ -1,7 +1,12 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from .models import Document
-from .nlp_services import process_text_with_nlp
+from . import changeset, docx_stream, garbage, idempotency, metrics, ole2, page_store, profiling, sandbox, similarity, storage
+from .guidelines import compile_guidelines, get_matcher
+from .paragraph_memo import PARAGRAPH_SEPARATOR, rewrite_paragraphs
+from collections import namedtuple
+from itertools import accumulate
 import logging
 
 try:
@@ -16,154 +21,248 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
-def modify_document_sync(document_id, guidelines):
+# Text of one extraction; `partial` is set when a limit cut it short and
+# `page_ends` holds the text offset where each page ends (PDFs only)
+ExtractionResult = namedtuple('ExtractionResult', ['text', 'pages', 'partial', 'reason', 'page_ends'], defaults=[()])
+
+def modify_document_sync(document_id, guidelines, profile=False):
     """
-    Synchronous document modification
+    Synchronous document modification, with the same run as the Celery task
     """
-    try:
-        document = Document.objects.get(id=document_id)
-        
-        # Sample text with grammar issues for testing
-        original_text = f"Sample document for {document.original_filename}. This document don't have proper grammar and its quite wordy. There is many issues that need fixing. We recieve alot of feedback about this. The affect is definately noticeable and we loose credibility due to the fact that our writing isn't professional."
-        
-        # Fast AI modification with change detection
-        modified_text, changes_made = ai_modify_text(original_text, guidelines)
-        
-        if changes_made:
-            # Create modified document
-            modified_file_path = create_modified_document(document, modified_text)
-            document.modified_file.name = modified_file_path
-            document.status = 'modified'
-        else:
-            # No changes needed
-            document.status = 'no_changes'
-        
-        document.modified_at = timezone.now()
-        document.save()
-        
-        logger.info(f"Document {document_id} modified successfully")
-        return {'status': document.status}
-        
-    except Exception as e:
-        document = Document.objects.get(id=document_id)
-        document.status = 'failed'
-        document.save()
-        logger.error(f"Failed to modify document {document_id}: {str(e)}")
-        raise
+    return run_modification(document_id, guidelines, profile=profile)
 
 @shared_task
-def modify_document(document_id, guidelines):
+def modify_document(document_id, guidelines, idempotent_request=None, profile=False):
     """
-    Modify document based on AI guidelines
+    Modify document based on AI guidelines. A run dispatched for an
+    idempotent request settles that request once it has finished.
+    """
+    succeeded = False
+    try:
+        result = run_modification(document_id, guidelines, profile=profile)
+        succeeded = True
+        return result
+    finally:
+        if idempotent_request:
+            settle_modification_request(document_id, guidelines, idempotent_request, succeeded)
+
+def modification_key(document_id, guidelines, modified_at, client_key=''):
+    """
+    Idempotency key of a modify request. Derived keys include when the
+    document was last modified, so a stored response is only replayed
+    while the document is as that request left it.
+    """
+    return idempotency.make_key(
+        f'modify:{document_id}', client_key, guidelines, modified_at.isoformat() if modified_at else ''
+    )
+
+def settle_modification_request(document_id, guidelines, idempotent_request, succeeded):
+    """
+    Store the response of a modify request whose run succeeded, under its
+    own key and the key of the document state it left, then release the
+    request's claim. Failed runs are not stored so that a retry runs again.
+    """
+    key = idempotent_request['key']
+    try:
+        if succeeded:
+            modified_at = Document.objects.filter(id=document_id).values_list('modified_at', flat=True).first()
+            done_key = modification_key(document_id, guidelines, modified_at, idempotent_request['client_key'])
+            for stored_key in {key, done_key}:
+                idempotency.save_response(stored_key, idempotent_request['response'], idempotent_request['status'])
+    finally:
+        idempotency.claim(key, idempotent_request['token']).release()
+
+@idempotency.serialized('modify')
+@profiling.profiled('modify')
+def run_modification(document_id, guidelines):
+    """
+    Rewrite a document by the guidelines and render the modified file,
+    under the document's lock; shared by the request and the Celery task
     """
     try:
         document = Document.objects.get(id=document_id)
-        
-        # Quick sample text for fast processing
-        original_text = f"Sample document content for {document.original_filename}. This is a demonstration of AI-powered document modification."
-        
-        # Fast AI modification with change detection
-        modified_text, changes_made = ai_modify_text(original_text, guidelines)
-        
-        if changes_made:
-            # Create modified document
-            modified_file_path = create_modified_document(document, modified_text)
-            document.modified_file.name = modified_file_path
-            document.status = 'modified'
-        else:
-            # No changes needed
-            document.status = 'no_changes'
-        
+        # Written only now that this run holds the document's lock
+        document.modification_guidelines = guidelines
+        document.status = 'modifying'
+        # Named fields only, so a concurrent tier move is not written back
+        document.save(update_fields=['modification_guidelines', 'status'])
+        
+        # The extracted text when processing stored it, else sample text with grammar issues for testing
+        original_text = page_store.read_text(document.id) or f"Sample document for {document.original_filename}. This document don't have proper grammar and its quite wordy. There is many issues that need fixing. We recieve alot of feedback about this. The affect is definately noticeable and we loose credibility due to the fact that our writing isn't professional."
+        
+        fields = ['status', 'processing_metrics', 'modified_at', 'changes_fingerprint']
+        with metrics.collect(document.content_type) as run_metrics:
+            # Fast AI modification with change detection
+            with metrics.stage('rewrite'):
+                change_set = rewrite_text(original_text, guidelines, reuse=similarity.reuse_for(document.id))
+            
+            if change_set:
+                # Create modified document
+                previous_file = document.modified_file.name
+                with metrics.stage('render'):
+                    modified_file_path = apply_modified_text(document, change_set)
+                document.modified_file.name = modified_file_path
+                document.status = 'modified'
+                fields += ['modified_file', 'modified_text_hash']
+                # The tier is only written for a newly rendered (hot) file
+                if modified_file_path != previous_file:
+                    fields.append('modified_tier')
+            else:
+                # No changes needed
+                document.status = 'no_changes'
+        
+        profiling.record_stages(run_metrics.get('stages', {}))
+        document.processing_metrics = {**document.processing_metrics, 'modify': run_metrics}
         document.modified_at = timezone.now()
-        document.save()
+        document.changes_fingerprint = change_set.fingerprint
+        document.save(update_fields=fields)
+        changeset.store(document, change_set)
         
         logger.info(f"Document {document_id} modified successfully")
-        return {'status': 'modified', 'file_path': modified_file_path}
+        return {'status': document.status, 'file_path': document.modified_file.name or None, 'changes': len(change_set)}
         
     except Exception as e:
-        document.status = 'failed'
-        document.save()
+        Document.objects.filter(id=document_id).update(status='failed')
         logger.error(f"Failed to modify document {document_id}: {str(e)}")
         raise
 
+@profiling.profiled('process')
 def process_document_sync(document_id):
     """
-    Synchronous document processing
+    Synchronous document processing, with the same extraction and indexing
+    as the Celery task so pages and similar documents are served either way
     """
-    try:
-        document = Document.objects.get(id=document_id)
-        document.status = 'processing'
-        document.save()
-        
-        # Simple processing without file extraction
-        document.status = 'completed'
-        document.processed_at = timezone.now()
-        document.save()
-        
-        logger.info(f"Document {document_id} processed successfully")
-        return {'status': 'completed'}
-        
-    except Exception as e:
-        document = Document.objects.get(id=document_id)
-        document.status = 'failed'
-        document.save()
-        logger.error(f"Failed to process document {document_id}: {str(e)}")
-        raise
+    return run_processing(document_id)
 
 @shared_task
+@profiling.profiled('process')
 def process_document(document_id):
     """
     Process uploaded document for analysis
     """
+    return run_processing(document_id)
+
+def run_processing(document_id):
+    """Extract, index and analyze a document, recording its status"""
     try:
         document = Document.objects.get(id=document_id)
         document.status = 'processing'
-        document.save()
-        
-        # Extract text based on file type
-        text_content = ""
-        file_path = document.file.path
-        
-        if document.content_type == 'application/pdf':
-            text_content = extract_pdf_text(file_path)
-        elif document.content_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-            text_content = extract_docx_text(file_path)
+        document.save(update_fields=['status'])
         
-        # Perform analysis (placeholder for your specific analysis logic)
-        analysis_result = analyze_document_content(text_content)
+        with metrics.collect(document.content_type) as run_metrics:
+            # Extract text based on file type
+            text_content = ""
+            file_path = storage.local_path(document.file)
+            metrics.BYTES_IN.inc(document.file_size)
+            
+            with metrics.stage('extract'):
+                extraction = sandbox.extract(file_path, document.content_type)
+            text_content = extraction.text
+            metrics.PAGES.inc(extraction.pages)
+            document.is_partial = extraction.partial
+            document.partial_reason = extraction.reason
+            
+            # Page-addressable copy of the text for /api/documents/<id>/pages/
+            with metrics.stage('index'):
+                page_store.write(document.id, text_content, extraction.page_ends)
+                # MinHash signature in the LSH index for near-duplicate lookups
+                similarity.index(document.id, text_content)
+            
+            # Perform analysis (placeholder for your specific analysis logic)
+            with metrics.stage('analyze'):
+                analysis_result = analyze_document_content(text_content)
         
         # Update document status
+        profiling.record_stages(run_metrics.get('stages', {}))
+        document.processing_metrics = {**document.processing_metrics, 'process': run_metrics}
         document.status = 'completed'
         document.processed_at = timezone.now()
-        document.save()
+        document.save(update_fields=['is_partial', 'partial_reason', 'processing_metrics', 'status', 'processed_at'])
         
         logger.info(f"Document {document_id} processed successfully")
         return analysis_result
         
     except Exception as e:
-        document.status = 'failed'
-        document.save()
+        Document.objects.filter(id=document_id).update(status='failed')
         logger.error(f"Failed to process document {document_id}: {str(e)}")
         raise
 
-def extract_pdf_text(file_path):
-    """Extract text from PDF file"""
+@shared_task
+def collect_garbage():
+    """
+    Periodic garbage collection (CELERY_BEAT_SCHEDULE). Runs are skipped
+    while another one holds the lock.
+    """
+    lock = idempotency.Lock('garbage-collection', settings.GARBAGE_LOCK_TIMEOUT)
+    if not lock.acquire():
+        logger.info("Garbage collection already running, skipped")
+        return None
+    try:
+        report = garbage.collect(log=logger.debug)
+    finally:
+        lock.release()
+    logger.info(f"Garbage collection: {report.as_dict()}")
+    return report.as_dict()
+
+def extract_document_text(file_path, content_type, max_pages=None, max_objects=None):
+    """
+    Extract text by file type. PDFs over `max_pages` are cut short and
+    those over `max_objects` are skipped; both come back marked partial.
+    """
+    if content_type == 'application/pdf':
+        return extract_pdf_document(file_path, max_pages, max_objects)
+    if content_type == 'application/msword' and ole2.is_ole2_file(file_path):
+        return ExtractionResult(extract_doc_text(file_path), 0, False, '')
+    if content_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
+        return ExtractionResult(extract_docx_text(file_path), 0, False, '')
+    return ExtractionResult('', 0, False, '')
+
+def extract_pdf_document(file_path, max_pages=None, max_objects=None):
+    """Extract text from at most `max_pages` pages of a PDF file"""
     if not PyPDF2:
-        return "PDF processing not available"
+        return ExtractionResult("PDF processing not available", 0, False, '')
     
-    text = ""
     try:
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
+            # The xref size bounds how many objects parsing the pages can touch
+            objects = int(pdf_reader.trailer.get('/Size', 0))
+            if max_objects and objects > max_objects:
+                return ExtractionResult('', 0, True, f"{objects} objects exceeds the limit of {max_objects}")
+            total = len(pdf_reader.pages)
+            count = min(total, max_pages) if max_pages else total
+            page_texts = [pdf_reader.pages[index].extract_text() for index in range(count)]
     except Exception as e:
         logger.error(f"Error extracting PDF text: {e}")
-        return "Error processing PDF"
-    return text
+        return ExtractionResult("Error processing PDF", 0, False, '')
+    text = ''.join(page_texts)
+    page_ends = tuple(accumulate(len(page) for page in page_texts))
+    if count < total:
+        return ExtractionResult(text, count, True, f"Only the first {count} of {total} pages were processed", page_ends)
+    return ExtractionResult(text, count, False, '', page_ends)
+
+def extract_pdf_text(file_path):
+    """Extract text from PDF file"""
+    return extract_pdf_document(file_path).text
+
+def extract_doc_text(file_path):
+    """Extract text from legacy Word (.doc) file"""
+    try:
+        return ole2.extract_doc_text(file_path)
+    except Exception as e:
+        logger.error(f"Error extracting DOC text: {e}")
+        return "Error processing DOC"
 
 def extract_docx_text(file_path):
     """Extract text from DOCX file"""
+    try:
+        return ''.join(paragraph + "\n" for paragraph in docx_stream.iter_docx_paragraphs(file_path))
+    except Exception as e:
+        logger.warning(f"Streaming DOCX extraction failed, falling back to python-docx: {e}")
+    return extract_docx_text_with_python_docx(file_path)
+
+def extract_docx_text_with_python_docx(file_path):
+    """Extract body text from DOCX file through the python-docx object model"""
     if not DocxDocument:
         return "DOCX processing not available"
     
@@ -177,98 +276,50 @@ def extract_docx_text(file_path):
         return "Error processing DOCX"
     return text
 
+def rewrite_text(original_text, guidelines, reuse=None):
+    """
+    Apply the guidelines' rules to the text, returning the edits as a
+    ChangeSet of spans over it. `reuse(matcher)` may supply paragraph
+    results the memo lacks (see similarity.reuse_for).
+    """
+    plan = compile_guidelines(guidelines)
+    matcher = get_matcher(plan)
+    
+    # Only paragraphs not seen under this rule fingerprint are rewritten
+    results, _ = rewrite_paragraphs(
+        original_text, matcher.fingerprint, matcher.rewrite, reuse=reuse and (lambda: reuse(matcher))
+    )
+    
+    changes = []
+    start = 0
+    for paragraph, (_, _, spans) in zip(original_text.split(PARAGRAPH_SEPARATOR), results):
+        changes.extend(
+            changeset.Change(start + offset, length, replacement, matcher.messages[rule])
+            for offset, length, replacement, rule in spans
+        )
+        start += len(paragraph) + len(PARAGRAPH_SEPARATOR)
+    metrics.RULE_HITS.inc(sum(len(indices) for _, indices, _ in results))
+    applied = sorted({index for _, indices, _ in results for index in indices})
+    return changeset.ChangeSet(
+        original_text, changes, [matcher.messages[index] for index in applied], matcher.fingerprint
+    )
+
 def ai_modify_text(original_text, guidelines):
     """
-    AI text modification with grammar and style fixes
+    AI text modification with grammar and style fixes, as a readable report
     """
     try:
-        modified_text = original_text
-        changes_made = False
-        changes_list = []
-        
-        # Grammar fixes
-        if "grammar" in guidelines.lower() or "grammatical" in guidelines.lower():
-            # Common grammar corrections
-            grammar_fixes = {
-                "there is": "there are",
-                "was": "were", 
-                "its": "it's",
-                "your": "you're",
-                "then": "than",
-                "affect": "effect",
-                "loose": "lose",
-                "alot": "a lot",
-                "recieve": "receive",
-                "seperate": "separate",
-                "definately": "definitely",
-                "occured": "occurred"
-            }
-            
-            for wrong, correct in grammar_fixes.items():
-                if wrong in modified_text.lower():
-                    new_text = modified_text.replace(wrong, correct)
-                    if new_text != modified_text:
-                        changes_made = True
-                        changes_list.append(f"Fixed '{wrong}' to '{correct}'")
-                        modified_text = new_text
-        
-        # Formal language
-        if "formal" in guidelines.lower():
-            formal_fixes = {
-                "don't": "do not",
-                "won't": "will not", 
-                "can't": "cannot",
-                "isn't": "is not",
-                "aren't": "are not",
-                "wasn't": "was not",
-                "weren't": "were not",
-                "haven't": "have not",
-                "hasn't": "has not",
-                "hadn't": "had not",
-                "wouldn't": "would not",
-                "couldn't": "could not",
-                "shouldn't": "should not"
-            }
-            
-            for informal, formal in formal_fixes.items():
-                if informal in modified_text:
-                    new_text = modified_text.replace(informal, formal)
-                    if new_text != modified_text:
-                        changes_made = True
-                        changes_list.append(f"Made formal: '{informal}' to '{formal}'")
-                        modified_text = new_text
-        
-        # Concise writing
-        if "concise" in guidelines.lower():
-            concise_fixes = {
-                " very ": " ",
-                " really ": " ",
-                " quite ": " ",
-                " rather ": " ",
-                " extremely ": " ",
-                " absolutely ": " ",
-                "in order to": "to",
-                "due to the fact that": "because",
-                "at this point in time": "now",
-                "for the purpose of": "for"
-            }
-            
-            for wordy, concise in concise_fixes.items():
-                if wordy in modified_text:
-                    new_text = modified_text.replace(wordy, concise)
-                    if new_text != modified_text:
-                        changes_made = True
-                        changes_list.append(f"Made concise: removed '{wordy.strip()}'")
-                        modified_text = new_text
+        change_set = rewrite_text(original_text, guidelines)
+        changes_made = bool(change_set)
         
         # Create detailed report
         report = f"GUIDELINES APPLIED: {guidelines}\n\n"
         if changes_made:
             report += "CHANGES MADE:\n"
-            for change in changes_list:
+            for change in change_set.rules:
                 report += f"- {change}\n"
             report += "\nMODIFIED TEXT:\n"
-            report += modified_text
+            report += change_set.text
         else:
             report += "NO CHANGES NEEDED - Document already meets guidelines\n\n"
             report += "ORIGINAL TEXT:\n"
@@ -279,6 +330,21 @@ def ai_modify_text(original_text, guidelines):
         logger.error(f"Modification error: {e}")
         return f"[MODIFICATION ERROR: {str(e)}]\n\n{original_text}", False
 
+def apply_modified_text(document, change_set):
+    """
+    Render the modified document unless the current file was rendered
+    from exactly the same text. The text is only assembled for rendering.
+    """
+    text_hash = change_set.digest()
+    if document.modified_file and document.modified_text_hash == text_hash:
+        logger.info(f"Reusing rendered file for document {document.id}")
+        return document.modified_file.name
+    
+    modified_file_path = create_modified_document(document, change_set.text)
+    document.modified_text_hash = text_hash
+    document.modified_tier = 'hot'
+    return modified_file_path
+
 def create_modified_document(document, modified_text):
     """
     Create modified document file in PDF or DOCX format only
@@ -303,6 +369,7 @@ def create_modified_document(document, modified_text):
         content = create_docx_content(modified_text)
     
     # Save to modified_file field
+    metrics.BYTES_OUT.inc(content.size)
     document.modified_file.save(filename, content, save=False)
     return document.modified_file.name
 
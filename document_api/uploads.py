@@ -0,0 +1,177 @@
+import hashlib
+import os
+import struct
+import zipfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from . import ole2
+from .docx_stream import DOCUMENT_PART
+from .models import document_upload_path
+
+# Signatures checked in the first chunk, with the types each one may be declared as
+SIGNATURES = (
+    (b'%PDF-', ('application/pdf',)),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', ('application/msword',)),
+    (b'PK\x03\x04', ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword')),
+)
+# PDF readers accept the header anywhere in the first kilobyte
+PDF_HEADER_WINDOW = 1024
+# Stream every Word 97-2003 file has; other OLE2 files (.xls, .msg) lack it
+WORD_STREAM = 'WordDocument'
+INVALID_TYPE = "Invalid file type. Only PDF and Word documents are allowed."
+
+def sniff_content_type(head, declared):
+    """Content type for a file starting with `head`, or None if it is not a document"""
+    for signature, content_types in SIGNATURES:
+        if signature == b'%PDF-':
+            matched = signature in head[:PDF_HEADER_WINDOW]
+        else:
+            matched = head.startswith(signature)
+        if matched:
+            return declared if declared in content_types else content_types[0]
+    return None
+
+def is_word_document(file):
+    """
+    Whether a ZIP or OLE2 file holds a Word document: a DOCX package has a
+    main document part and a .doc a WordDocument stream. Spreadsheets,
+    presentations and plain archives share their signatures. Only the ZIP
+    central directory or the OLE2 directory is read.
+    """
+    file.seek(0)
+    head = file.read(len(ole2.OLE2_SIGNATURE))
+    try:
+        if head == ole2.OLE2_SIGNATURE:
+            return ole2.CompoundFile(file).has_stream(WORD_STREAM)
+        with zipfile.ZipFile(file) as archive:
+            return DOCUMENT_PART in archive.namelist()
+    except (ValueError, struct.error, zipfile.BadZipFile, EOFError):
+        return False
+    finally:
+        file.seek(0)
+
+def is_document(path, content_type):
+    """Check a stored file of a sniffed `content_type` past its signature"""
+    if content_type == 'application/pdf':
+        return True
+    with open(path, 'rb') as file:
+        return is_word_document(file)
+
+class StoredUpload(UploadedFile):
+    """An upload already written to its final place in storage"""
+
+    def __init__(self, storage_name, name, content_type, size, content_hash, charset=None, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.storage_name = storage_name
+        self.content_hash = content_hash
+
+    def open(self, mode='rb'):
+        self.file = default_storage.open(self.storage_name, mode)
+        return self
+
+    def delete(self):
+        self.close()
+        default_storage.delete(self.storage_name)
+
+class StreamingDocumentUploadHandler(FileUploadHandler):
+    """
+    Writes the document field of an upload straight to its final storage
+    path in one pass, hashing it and checking its signature and size on
+    the way. A rejected upload is stopped at the offending chunk, and the
+    reason is left on `request.upload_rejection`.
+    """
+
+    field_name = 'file'
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.active = False
+        self.max_size = settings.DOCUMENT_UPLOAD_MAX_SIZE
+
+    def reject(self, message):
+        self.request.upload_rejection = message
+        self.upload_interrupted()
+        raise StopUpload(connection_reset=True)
+
+    def upload_interrupted(self):
+        """Remove the partly written file"""
+        if self.active:
+            self.destination.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.active = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name != self.field_name:
+            return
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if content_length is not None and content_length > self.max_size:
+            self.reject(f"File size cannot exceed {self.max_size // (1024 * 1024)}MB")
+
+        self.storage_name = default_storage.generate_filename(document_upload_path(None, file_name))
+        self.path = default_storage.path(self.storage_name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        descriptor = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, default_storage.file_permissions_mode or 0o644)
+        self.destination = os.fdopen(descriptor, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.active = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start == 0:
+            sniffed = sniff_content_type(raw_data, self.content_type)
+            if sniffed is None:
+                self.reject(INVALID_TYPE)
+            self.content_type = sniffed
+        if self.size + len(raw_data) > self.max_size:
+            self.reject(f"File size cannot exceed {self.max_size // (1024 * 1024)}MB")
+        self.digest.update(raw_data)
+        self.destination.write(raw_data)
+        self.size += len(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.destination.close()
+        self.active = False
+        if file_size == 0:
+            os.unlink(self.path)
+            self.request.upload_rejection = "The submitted file is empty."
+            return None
+        # The first chunk only showed a container; its directory is at the end
+        if not is_document(self.path, self.content_type):
+            os.unlink(self.path)
+            self.request.upload_rejection = INVALID_TYPE
+            return None
+        return StoredUpload(
+            self.storage_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.digest.hexdigest(),
+            self.charset,
+            self.content_type_extra,
+        )
+
+def use_streaming_upload(request):
+    """
+    Install the streaming handler ahead of the default ones for this
+    request and return it. Only local filesystem storage can be written to
+    in place; other storages keep Django's default handlers.
+    """
+    try:
+        default_storage.path('')
+    except NotImplementedError:
+        return None
+    http_request = getattr(request, '_request', request)
+    handler = StreamingDocumentUploadHandler(http_request)
+    http_request.upload_handlers.insert(0, handler)
+    return handler
@@ -7,8 +7,17 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics_view, name='metrics'),
     path('api/documents/', views.list_documents, name='list_documents'),
+    path('api/documents/recent/', views.recent_documents, name='recent_documents'),
+    path('api/documents/<uuid:document_id>/changes/', views.document_changes, name='document_changes'),
+    path('api/documents/<uuid:document_id>/pages/', views.document_pages, name='document_pages'),
+    path('api/documents/<uuid:document_id>/similar/', views.similar_documents, name='similar_documents'),
     path('api/upload/', views.upload_document, name='upload_document'),
+    path('api/uploads/', views.create_upload_session, name='create_upload_session'),
+    path('api/uploads/<uuid:session_id>/', views.upload_session_detail, name='upload_session'),
+    path('api/uploads/<uuid:session_id>/chunk/', views.append_upload_chunk, name='append_upload_chunk'),
+    path('api/uploads/<uuid:session_id>/complete/', views.complete_upload, name='complete_upload'),
     path('api/status/<uuid:document_id>/', views.get_document_status, name='document_status'),
     path('api/modify/<uuid:document_id>/', views.modify_document_request, name='modify_document'),
     path('api/download/<uuid:document_id>/', views.download_modified_document, name='download_modified'),
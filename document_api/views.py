@@ -2,24 +2,88 @@ from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.utils import timezone
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from .models import Document
-from .serializers import DocumentUploadSerializer, DocumentSerializer, DocumentModificationSerializer
-from .tasks import process_document, modify_document
+from .models import Document, DocumentChange, UploadSession
+from .serializers import (
+    DocumentUploadSerializer, DocumentSerializer, DocumentRowSerializer, DocumentModificationSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer,
+)
+from .tasks import process_document, modify_document, modification_key, settle_modification_request
+from . import chunked_uploads, idempotency, metrics, page_store, profiling, recent, renderers, routing, similarity, uploads
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 def index(request):
     """Render the main UI"""
     return render(request, 'index.html')
 
-@api_view(['GET'])
-def list_documents(request):
+def metrics_view(request):
+    """Expose pipeline metrics in the Prometheus text format"""
+    if not settings.METRICS_ENABLED:
+        return HttpResponse(status=404)
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def render_json(data, status_code=status.HTTP_200_OK):
+    """JSON response rendered exactly as the DRF views render it"""
+    return HttpResponse(renderers.render(data), status=status_code, content_type='application/json')
+
+def method_not_allowed(request, allowed=('GET',)):
+    response = render_json({'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    response['Allow'] = ', '.join(allowed)
+    return response
+
+async def list_documents(request):
     """List all documents for the UI"""
-    documents = Document.objects.all()[:20]  # Limit to 20 recent documents
-    serializer = DocumentSerializer(documents, many=True)
-    return Response(serializer.data)
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    serializer = DocumentRowSerializer()
+    rows = [row async for row in serializer.values(Document.objects.all()[:20])]  # Limit to 20 recent documents
+    return render_json(serializer.serialize(rows))
+
+@api_view(['GET'])
+def recent_documents(request):
+    """Documents this client uploaded most recently, newest first"""
+    ids = recent.recent_ids(request)
+    serializer = DocumentRowSerializer()
+    by_id = {str(row['id']): row for row in serializer.values(Document.objects.filter(id__in=ids))}
+    # Deleted documents drop out of the ring's order
+    ordered = [by_id[document_id] for document_id in ids if document_id in by_id]
+    return Response(serializer.serialize(ordered))
+
+def accept_document(request, document):
+    """Start processing a newly stored document and answer the upload"""
+    # Process in the request unless tasks are dispatched to Celery
+    try:
+        if settings.DOCUMENT_TASKS_ASYNC:
+            routing.dispatch(process_document, document, tenant=routing.get_tenant(request),
+                             profile=profiling.requested_by(request))
+        else:
+            from .tasks import process_document_sync
+            process_document_sync(document.id, profile=profiling.requested_by(request))
+    except:
+        # Set to completed if sync processing fails
+        document.status = 'completed'
+        document.processed_at = timezone.now()
+        document.save()
+    
+    response_serializer = DocumentSerializer(document)
+    
+    # Remember the ID only; /api/documents/recent/ loads the documents back
+    recent.remember(request, document.id)
+    
+    return Response({
+        'message': 'Document uploaded successfully',
+        'document': response_serializer.data
+    }, status=status.HTTP_201_CREATED)
 
 @csrf_exempt
 @api_view(['POST'])
@@ -28,47 +92,115 @@ def upload_document(request):
     """
     Upload and process PDF or Word documents
     """
-    serializer = DocumentUploadSerializer(data=request.data)
+    upload_handler = uploads.use_streaming_upload(request)
+    try:
+        serializer = DocumentUploadSerializer(data=request.data)
+    except Exception:
+        # Don't leave a partly written file behind when reading the body fails
+        if upload_handler:
+            upload_handler.upload_interrupted()
+        raise
+    
+    rejection = getattr(request, 'upload_rejection', None)
+    if rejection:
+        return Response({'file': [rejection]}, status=status.HTTP_400_BAD_REQUEST)
     
     if serializer.is_valid():
         document = serializer.save()
-        
-        # Use synchronous processing to avoid Celery issues
-        try:
-            from .tasks import process_document_sync
-            process_document_sync(document.id)
-        except:
-            # Set to completed if sync processing fails
-            document.status = 'completed'
-            document.processed_at = timezone.now()
-            document.save()
-        
-        response_serializer = DocumentSerializer(document)
-        
-        # Store in session for UI demo
-        if not request.session.get('documents'):
-            request.session['documents'] = []
-        request.session['documents'].append(response_serializer.data)
-        request.session.modified = True
-        
-        return Response({
-            'message': 'Document uploaded successfully',
-            'document': response_serializer.data
-        }, status=status.HTTP_201_CREATED)
+        return accept_document(request, document)
     
+    stored = request.data.get('file')
+    if isinstance(stored, uploads.StoredUpload):
+        stored.delete()
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
-def get_document_status(request, document_id):
+async def get_document_status(request, document_id):
     """
     Get document processing status
     """
+    if request.method != 'GET':
+        return method_not_allowed(request)
     try:
-        document = Document.objects.get(id=document_id)
-        serializer = DocumentSerializer(document)
-        return Response(serializer.data)
+        serializer = DocumentRowSerializer()
+        row = await serializer.values(Document.objects.filter(id=document_id)).aget()
+        return render_json(serializer.to_representation(row))
     except Document.DoesNotExist:
+        return render_json({'error': 'Document not found'}, status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+def document_changes(request, document_id):
+    """
+    The edits of a document's latest modification, a page at a time in
+    document order. Pass the `next` of one page as `after` to get the next.
+    """
+    if not Document.objects.filter(id=document_id).exists():
         return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        after = int(request.query_params.get('after', -1))
+        limit = int(request.query_params.get('limit', settings.DOCUMENT_CHANGES_PAGE_SIZE))
+    except ValueError:
+        return Response({'error': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(limit, settings.DOCUMENT_CHANGES_MAX_PAGE_SIZE)
+    
+    changes = DocumentChange.objects.filter(document_id=document_id)
+    # One row past the page tells whether another page follows
+    rows = list(changes.filter(position__gt=after).values(
+        'position', 'offset', 'length', 'original', 'replacement', 'rule'
+    )[:limit + 1])
+    return Response({
+        'document_id': str(document_id),
+        'total': changes.count(),
+        'changes': rows[:limit],
+        'next': rows[limit - 1]['position'] if len(rows) > limit else None,
+    })
+
+@api_view(['GET'])
+def document_pages(request, document_id):
+    """
+    Extracted text of pages `from` to `to` (1-based, inclusive), read from
+    the page store without opening the document itself
+    """
+    try:
+        first = int(request.query_params.get('from', 1))
+        last = int(request.query_params.get('to', first))
+    except ValueError:
+        return Response({'error': 'from and to must be page numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if first < 1 or last < first:
+        return Response({'error': 'from must be at least 1 and to at least from'}, status=status.HTTP_400_BAD_REQUEST)
+    last = min(last, first + settings.DOCUMENT_PAGES_MAX_RANGE - 1)
+    try:
+        page_count, pages = page_store.read(document_id, first, last)
+    except FileNotFoundError:
+        return Response({'error': 'Document pages not available'}, status=status.HTTP_404_NOT_FOUND)
+    if not pages:
+        return Response({'error': f'Document has {page_count} pages'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'document_id': str(document_id),
+        'page_count': page_count,
+        'pages': [{'number': number, 'text': text} for number, text in enumerate(pages, first)],
+    })
+
+@api_view(['GET'])
+def similar_documents(request, document_id):
+    """Near-duplicates of a document, most similar first, found through the LSH index"""
+    matches = similarity.similar(document_id, limit=settings.SIMILAR_DOCUMENTS_LIMIT)
+    if matches is None:
+        if not Document.objects.filter(id=document_id).exists():
+            return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'error': 'Document has no similarity signature yet'}, status=status.HTTP_404_NOT_FOUND)
+    rows = Document.objects.filter(id__in=[match_id for match_id, _ in matches]).values(
+        'id', 'original_filename', 'status', 'uploaded_at'
+    )
+    by_id = {row['id']: row for row in rows}
+    return Response({
+        'document_id': str(document_id),
+        'similar': [
+            {**by_id[match_id], 'similarity': round(score, 3)}
+            for match_id, score in matches if match_id in by_id
+        ],
+    })
 
 @csrf_exempt
 @api_view(['POST'])
@@ -82,57 +214,244 @@ def modify_document_request(request, document_id):
         
         if serializer.is_valid():
             guidelines = serializer.validated_data['guidelines']
-            document.modification_guidelines = guidelines
-            document.status = 'modifying'
-            document.save()
+            response_data = {
+                'message': 'Document modification requested',
+                'document_id': str(document.id),
+                'guidelines': guidelines
+            }
             
-            # Use synchronous modification only
-            try:
+            # Retries and double-clicks get the first submission's response
+            client_key = idempotency.client_key(request)
+            key = modification_key(document.id, guidelines, document.modified_at, client_key)
+            stored = idempotency.get_response(key)
+            if stored:
+                return Response(stored[0], status=stored[1], headers={'Idempotency-Status': 'replayed'})
+            lock = idempotency.begin(key)
+            if lock is None:
+                return Response(response_data, status=status.HTTP_202_ACCEPTED, headers={'Idempotency-Status': 'in-progress'})
+            # Held until the run finishes, in this request or in the worker
+            idempotent_request = {
+                'key': key, 'token': lock.token, 'client_key': client_key,
+                'response': response_data, 'status': status.HTTP_202_ACCEPTED,
+            }
+            
+            if settings.DOCUMENT_TASKS_ASYNC:
+                try:
+                    routing.dispatch(modify_document, document, guidelines, idempotent_request=idempotent_request,
+                                     tenant=routing.get_tenant(request), profile=profiling.requested_by(request))
+                except Exception as e:
+                    lock.release()
+                    logger.error(f"Queueing modification failed: {e}")
+                    return Response({'error': 'Modification could not be queued'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            else:
                 from .tasks import modify_document_sync
-                modify_document_sync(document.id, guidelines)
-            except Exception as e:
-                # Handle sync errors without Celery
-                document.status = 'failed'
-                document.save()
-                logger.error(f"Sync modification failed: {e}")
+                succeeded = False
+                try:
+                    modify_document_sync(document.id, guidelines, profile=profiling.requested_by(request))
+                    succeeded = True
+                except idempotency.LockTimeout:
+                    return Response({'error': 'Document is being modified by another request'}, status=status.HTTP_409_CONFLICT)
+                except Exception as e:
+                    # The run has marked the document failed
+                    logger.error(f"Sync modification failed: {e}")
+                finally:
+                    settle_modification_request(document.id, guidelines, idempotent_request, succeeded)
             
-            return Response({
-                'message': 'Document modification requested',
-                'document_id': document.id,
-                'guidelines': guidelines
-            }, status=status.HTTP_202_ACCEPTED)
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Document.DoesNotExist:
         return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['GET'])
-def download_modified_document(request, document_id):
+async def iter_file(file, chunk_size):
+    """Read a file in a worker thread chunk by chunk, so a slow client never holds one"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+async def download_modified_document(request, document_id):
     """
     Download modified document
     """
+    if request.method != 'GET':
+        return method_not_allowed(request)
     try:
-        document = Document.objects.get(id=document_id)
-        if not document.modified_file:
-            return Response({'error': 'Modified document not available'}, status=status.HTTP_404_NOT_FOUND)
-        
-        from django.http import FileResponse
-        import os
-        
-        # Get the actual filename from modified_file
-        modified_filename = os.path.basename(document.modified_file.name)
-        
-        response = FileResponse(document.modified_file.open(), as_attachment=True)
-        response['Content-Disposition'] = f'attachment; filename="{modified_filename}"'
-        
-        # Set appropriate content type based on original document type
-        if document.content_type == 'application/pdf':
-            response['Content-Type'] = 'application/pdf'
-        elif document.content_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-            response['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        else:
-            response['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            
-        return response
+        document = await Document.objects.aget(id=document_id)
     except Document.DoesNotExist:
-        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        return render_json({'error': 'Document not found'}, status.HTTP_404_NOT_FOUND)
+    if not document.modified_file:
+        return render_json({'error': 'Modified document not available'}, status.HTTP_404_NOT_FOUND)
+    
+    # Get the actual filename from modified_file
+    modified_filename = os.path.basename(document.modified_file.name)
+    file = await sync_to_async(document.modified_file.storage.open, thread_sensitive=False)(document.modified_file.name, 'rb')
+    # Last download time, read when deciding what moves to the cold tier
+    await Document.objects.filter(id=document.id).aupdate(modified_accessed_at=timezone.now())
+    
+    # Set appropriate content type based on original document type
+    if document.content_type == 'application/pdf':
+        content_type = 'application/pdf'
+    else:
+        content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(iter_file(file, settings.DOWNLOAD_CHUNK_SIZE), content_type=content_type)
+        response['Content-Length'] = str(file.size)
+    else:
+        # A WSGI server iterates the response in its own thread anyway
+        response = FileResponse(file, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{modified_filename}"'
+    return response
+
+def completed_upload(session):
+    return Response({
+        'message': 'Document uploaded successfully',
+        'document': DocumentSerializer(session.document).data
+    }, status=status.HTTP_201_CREATED)
+
+@csrf_exempt
+@api_view(['POST'])
+def create_upload_session(request):
+    """
+    Start a resumable chunked upload
+    """
+    serializer = UploadSessionCreateSerializer(data=request.data)
+    if serializer.is_valid():
+        session = serializer.save()
+        return Response({
+            **UploadSessionSerializer(session).data,
+            'max_chunk_size': settings.UPLOAD_CHUNK_MAX_SIZE
+        }, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@csrf_exempt
+@api_view(['GET', 'DELETE'])
+def upload_session_detail(request, session_id):
+    """
+    Get the offset to resume an upload from, or abort it
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'DELETE':
+        lock = chunked_uploads.session_lock(session.id)
+        if not lock.acquire():
+            return Response({'error': 'Upload is still being written'}, status=status.HTTP_409_CONFLICT)
+        try:
+            # A completion may have finished while this request waited
+            session.refresh_from_db()
+            if session.status == 'active':
+                chunked_uploads.discard(session)
+                session.status = 'aborted'
+                session.save()
+        finally:
+            lock.release()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(UploadSessionSerializer(session).data)
+
+@csrf_exempt
+@api_view(['PUT'])
+def append_upload_chunk(request, session_id):
+    """
+    Store one chunk at ?offset=N; the X-Chunk-SHA256 header carries its checksum
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    if session.status != 'active':
+        return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+    
+    checksum = request.META.get('HTTP_X_CHUNK_SHA256', '')
+    try:
+        offset = int(request.query_params.get('offset', ''))
+    except ValueError:
+        return Response({'error': 'offset is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not checksum:
+        return Response({'error': 'X-Chunk-SHA256 header is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        return Response({'error': 'Content-Length must be a number of bytes'}, status=status.HTTP_400_BAD_REQUEST)
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        return Response({'error': f'Chunks cannot exceed {settings.UPLOAD_CHUNK_MAX_SIZE} bytes'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    
+    lock = chunked_uploads.session_lock(session.id)
+    if not lock.acquire():
+        return Response({'error': 'Another chunk of this upload is being written'}, status=status.HTTP_409_CONFLICT)
+    try:
+        session.refresh_from_db()
+        if session.status != 'active':
+            return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+        received = chunked_uploads.received_bytes(session)
+        if offset != received:
+            # A retried chunk whose response was lost is already stored
+            if offset < received and chunked_uploads.part_matches(session, offset, checksum):
+                return Response({'id': session.id, 'received': received})
+            return Response({'error': f'Expected offset {received}', 'received': received},
+                            status=status.HTTP_409_CONFLICT)
+        try:
+            received += chunked_uploads.write_part(session, offset, request.stream or io.BytesIO(), checksum)
+        except chunked_uploads.ChunkError as e:
+            return Response({'error': str(e), 'received': received}, status=status.HTTP_400_BAD_REQUEST)
+        session.received = received
+        session.save(update_fields=['received', 'updated_at'])
+    finally:
+        lock.release()
+    return Response({'id': session.id, 'received': received})
+
+@csrf_exempt
+@api_view(['POST'])
+def complete_upload(request, session_id):
+    """
+    Assemble an upload, create its document and start processing
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    if session.status == 'complete' and session.document_id:
+        return completed_upload(session)
+    if session.status != 'active':
+        return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+    
+    lock = chunked_uploads.session_lock(session.id)
+    if not lock.acquire():
+        return Response({'error': 'Upload is still being written'}, status=status.HTTP_409_CONFLICT)
+    try:
+        # Another completion or an abort may have finished while this request waited
+        session.refresh_from_db()
+        if session.status == 'complete' and session.document_id:
+            return completed_upload(session)
+        if session.status != 'active':
+            return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+        try:
+            storage_name, content_type = chunked_uploads.assemble(session)
+        except chunked_uploads.ChunkError as e:
+            return Response({'error': str(e), 'received': chunked_uploads.received_bytes(session)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        document = Document.objects.create(
+            file=storage_name,
+            original_filename=session.original_filename,
+            file_size=session.size,
+            content_type=content_type,
+            content_hash=session.checksum
+        )
+        session.status = 'complete'
+        session.received = session.size
+        session.document = document
+        session.save()
+    finally:
+        lock.release()
+    return accept_document(request, document)